@@ -0,0 +1,161 @@
+"""
+Micro-benchmark: detect_metadata_filter before and after the precompiled matcher.
+
+The legacy function is kept here verbatim (as it was in main.py) so both
+versions run over the same corpus of questions. data/section_triggers.json
+has since retargeted many filters to page titles, so the equality check
+runs the matcher over the legacy trigger table; it verifies the matching,
+not the filters. Run from backend/:
+
+    python benchmarks/bench_metadata_filter.py
+"""
+
+import json
+import os
+import re
+import sys
+import timeit
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.metadata_filter import TRIGGERS_PATH, TriggerMatcher, detect_metadata_filter
+
+QUESTIONS = Path(__file__).with_name("questions.txt").read_text(encoding="utf-8").splitlines()
+ROUNDS = 200
+
+
+# the trigger table as it was in main.py
+LEGACY_MAPPING = {
+    # --- St. Jude navigation & new patients ---
+    "new patient":      {"section": {"$eq": "Information for New Patients | St. Jude Care & Treatment"}},
+    "first visit":      {"section": {"$eq": "Information for New Patients | St. Jude Care & Treatment"}},
+
+    # --- Housing ---
+    "housing":          {"section": {"$eq": "Housing and Patient Services - St. Jude Children’s Research Hospital"}},
+    "target house":     {"section": {"$eq": "Housing and Patient Services"}},
+    "tri delta":        {"section": {"$eq": "Housing and Patient Services"}},
+    "domino's village": {"section": {"$eq": "Domino's Village Menu"}},
+
+    # --- Food services / menus ---
+    "kay kafe":         {"section": {"$eq": "Kay Kafe Menu"}},
+    "kay cafe":         {"section": {"$eq": "Kay Kafe Menu"}},
+    "room service":     {"section": {"$eq": "Room Service Menu - St. Jude Children’s Research Hospital"}},
+    "isolation":        {"section": {"$eq": "Isolation To-Go Menu - St. Jude Children’s Research Hospital"}},
+    "menu":             {"section": {"$eq": "Kay Kafe Menu"}},
+    # "eat":              {"section": {"$eq": "Kay Kafe Menu | Breakfast | Lunch | Dinner"}},
+
+    # --- Logistics ---
+    "parking":          {"section": {"$eq": "Parking and Construction | St. Jude Care & Treatment"}},
+    "directions":       {"section": {"$eq": "Parking and Construction | St. Jude Care & Treatment"}},
+    "visitor":          {"section": {"$eq": "Visitors"}},
+
+    # --- Patient portal & programs ---
+    "mychart":          {"section": {"$eq": "St. Jude MyChart"}},
+    "child life":       {"section": {"$eq": "Child Life | St. Jude Care & Treatment"}},
+    "school program":   {"section": {"$eq": "The St. Jude School Program | St. Jude Care & Treatment"}},
+
+    # --- Clinical trials / research ---
+    "clinical trial":   {"section": {"$eq": "Clinical Trials | St. Jude Care & Treatment"}},
+    "consent":          {"section": {"$eq": "Understanding and signing consent forms"}},
+
+    # --- Policies / legal ---
+    "hipaa":            {"title":   {"$eq": "Notice of Privacy Practices (HIPAA) - St. Jude Children’s Research Hospital"}},
+    "privacy":          {"section": {"$eq": "Privacy & Legal"}},
+    "nondiscrimination":{"section": {"$eq": "Discrimination is against the law"}},
+
+    # --- Support services / community ---
+    "concierge":        {"section": {"$eq": "Best Upon Request Concierge Service\u202f | St. Jude Care & Treatment"}},
+    "st. jude voice":   {"section": {"$eq": "St. Jude Voice: Our Virtual Adviser community | St. Jude Care & Treatment"}},
+
+    # --- Treatments ---
+    "chemotherapy":     {"section": {"$eq": "Chemotherapy"}},
+    "radiation":        {"section": {"$eq": "Radiation therapy"}},
+    "surgery":          {"section": {"$eq": "Surgery"}},
+    "targeted therapy": {"section": {"$eq": "Targeted therapy"}}
+}
+
+
+def legacy_detect_metadata_filter(query: str) -> Optional[Dict[str, Any]]:
+    """
+    Look for trigger phrases in the query and return an appropriate
+    metadata filter for your vector store.
+    """
+    q = query.lower()
+    # 2) detect_metadata_filter() dictionary
+    mapping = LEGACY_MAPPING
+
+    # Regex-based mapping: if query contains both "eat" and "where"
+    PAIR_RULES: List[Tuple[re.Pattern, List[str]]] = [
+    # where + eat → any dining section
+    (re.compile(r"\b(?:where|location|find|near|place|available|open|closest|nearby|there)\b.*\b(?:eat|food|meal|dining|cafe|kafe|menu|restaurant|cafeteria|kitchen|snack|coffee)\b"
+    r"|"
+    r"\b(?:eat|food|meal|dining|cafe|kafe|menu|restaurant|cafeteria|kitchen|snack|coffee)\b.*\b(?:where|location|find|near|place|available|open|closest|nearby|there)\b", re.I),
+     ["Domino's Village Menu",
+     'Sunday',
+     'Breakfast',
+     'Lunch',
+     'Dinner',
+     'Saturday',
+     'Isolation To-Go Menu - St. Jude Children’s Research Hospital',
+     'Inpatient Room Service Daily Dinner Special',
+     'Friday',
+     'Monday',
+     'Tuesday',
+     'Wednesday',
+     'Thursday',
+     'Room Service Menu - St. Jude Children’s Research Hospital',
+     'Kay Kafe Menu',
+     'Meal Plans and Assistance - St. Jude Children’s Research Hospital',
+     'Snack Bags - St. Jude Children’s Research Hospital',
+     'Starbucks - St. Jude Children’s Research Hospital',
+     'Contact Us - St. Jude Children’s Research Hospital',
+     'Food on Campus'])
+]
+    # regex_mapping = [
+    #     (
+    #         re.compile(r"\bwhere\b.*\beat\b|\beat\b.*\bwhere\b"),
+    #         [
+    #             {"section": {"$eq": "Breakfast"}},
+    #             {"section": {"$eq": "Lunch"}},
+    #             {"section": {"$eq": "Dinner"}},
+    #         ]
+    #     )
+    # ]
+
+    for trigger, filt in mapping.items():
+        if trigger in q:
+            return filt
+
+    for pat, sections in PAIR_RULES:
+        if pat.search(query):
+            return {"section": {"$in": sections}}
+    return None
+
+
+def main():
+    with open(TRIGGERS_PATH, encoding="utf-8") as fh:
+        pair_rules = json.load(fh)["pair_rules"]
+    legacy_matcher = TriggerMatcher(
+        [{"phrase": phrase, "filter": filt} for phrase, filt in LEGACY_MAPPING.items()],
+        pair_rules,
+    )
+    mismatches = [
+        q for q in QUESTIONS
+        if legacy_detect_metadata_filter(q) != legacy_matcher.match(q)
+    ]
+    if mismatches:
+        print("Outputs differ for:")
+        for q in mismatches:
+            print(f"  {q!r}")
+
+    n = ROUNDS * len(QUESTIONS)
+    print(f"{len(QUESTIONS)} questions x {ROUNDS} rounds")
+    for name, fn in (("legacy", legacy_detect_metadata_filter), ("matcher", detect_metadata_filter)):
+        seconds = timeit.timeit(lambda: [fn(q) for q in QUESTIONS], number=ROUNDS)
+        print(f"{name:<8}{seconds / n * 1e6:>10.2f} us/question")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Recall/latency/memory report for the flat index precisions.
+
+For each of float32, float16 and int8 this loads the flat snapshot,
+answers the same queries and reports the bytes of the matrix the coarse
+search scans, mean/p95 latency (and mean latency relative to float32)
+and recall@10 against exact float32 search. The run fails (exit status
+1) when a precision's recall@10 falls more than RECALL_TOLERANCE below
+float32's, i.e. below 1 - RECALL_TOLERANCE.
+
+The quantized precisions trade latency for memory: they scan a smaller
+matrix but convert it to float32 block by block before the product, and
+that conversion costs more than the float32 scan it replaces.
+
+    python benchmarks/bench_quantization.py                 # snapshot from ingest
+    python benchmarks/bench_quantization.py --synthetic 6000
+
+The questions in benchmarks/questions.txt are used as queries when the
+embedding model is available; otherwise (and with --synthetic) perturbed
+copies of indexed vectors are used.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.flat_index import PRECISIONS, FlatIndex, export_snapshot
+
+K = 10
+N_QUERIES = 200
+# largest recall@10 loss against exact float32 search a precision may show
+RECALL_TOLERANCE = 0.01
+
+
+class _SyntheticCollection:
+    """Clustered unit vectors shaped like MiniLM embeddings, behind the collection API."""
+
+    def __init__(self, n, dim=384, clusters=50, seed=0):
+        rng = np.random.default_rng(seed)
+        centers = rng.normal(size=(clusters, dim))
+        labels = rng.integers(0, clusters, size=n)
+        self.embeddings = (centers[labels] + 0.6 * rng.normal(size=(n, dim))).astype(np.float32)
+        self.labels = labels
+
+    def count(self):
+        return len(self.embeddings)
+
+    def get(self, limit, offset, include):
+        rows = range(offset, min(offset + limit, len(self.embeddings)))
+        return {
+            "ids": [f"chunk-{i}" for i in rows],
+            "documents": [f"chunk {i}" for i in rows],
+            "metadatas": [{"section": f"section-{self.labels[i]}"} for i in rows],
+            "embeddings": self.embeddings[offset:offset + limit],
+        }
+
+
+def perturbed_queries(matrix, n, seed=1):
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(matrix), size=n)
+    return np.asarray(matrix[picks]) + 0.05 * rng.normal(size=(n, matrix.shape[1])).astype(np.float32)
+
+
+def question_queries():
+    try:
+        from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+    except ImportError:
+        return None
+    questions = Path(__file__).with_name("questions.txt").read_text(encoding="utf-8").splitlines()
+    return np.asarray(DefaultEmbeddingFunction()([f"query: {q}" for q in questions]), dtype=np.float32)
+
+
+def run(path, queries, tolerance=RECALL_TOLERANCE):
+    """
+    Prints the report and returns the precisions whose recall is out of tolerance.
+    """
+    exact = FlatIndex.load(path, precision="float32")
+    truth = [set(ids) for ids in exact.query(query_embeddings=queries, n_results=K, include=[])["ids"]]
+
+    print(f"{exact.count()} rows x {exact.matrix.shape[1]} dims, {len(queries)} queries, recall@{K} vs float32")
+    print(f"recall tolerance: {tolerance} (minimum recall {1 - tolerance:.4f})")
+    print(f"{'precision':<10}{'scan MB':>9}{'mean ms':>9}{'p95 ms':>9}{'vs f32':>8}{'recall':>8}")
+    failed = []
+    baseline = None
+    for precision in PRECISIONS:
+        index = FlatIndex.load(path, precision=precision)
+        scanned = index.matrix if index.coarse is None else index.coarse
+        nbytes = scanned.nbytes + (index.scales.nbytes if index.scales is not None else 0)
+
+        latencies, hits = [], 0
+        for query, expected in zip(queries, truth):
+            start = time.perf_counter()
+            found = index.query(query_embeddings=query[None, :], n_results=K, include=[])["ids"][0]
+            latencies.append((time.perf_counter() - start) * 1000)
+            hits += len(expected.intersection(found))
+
+        mean = float(np.mean(latencies))
+        baseline = baseline or mean
+        recall = hits / (K * len(queries))
+        ok = recall >= 1 - tolerance
+        if not ok:
+            failed.append(precision)
+        print(
+            f"{precision:<10}{nbytes / 2**20:>9.2f}{mean:>9.3f}"
+            f"{np.percentile(latencies, 95):>9.3f}{mean / baseline:>7.1f}x{recall:>8.4f}"
+            f"{'' if ok else '  below tolerance'}"
+        )
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chroma-path", default=None, help="defaults to the API's CHROMA_PATH")
+    parser.add_argument("--synthetic", type=int, default=0, help="benchmark N synthetic vectors instead")
+    parser.add_argument("--tolerance", type=float, default=RECALL_TOLERANCE, help="allowed recall@10 loss vs float32")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        path = tempfile.mkdtemp()
+        collection = _SyntheticCollection(args.synthetic)
+        export_snapshot(collection, path)
+        queries = perturbed_queries(collection.embeddings, N_QUERIES)
+    else:
+        from utils.chroma_store import CHROMA_PATH
+
+        path = args.chroma_path or CHROMA_PATH
+        queries = question_queries()
+        if queries is None:
+            queries = perturbed_queries(FlatIndex.load(path).matrix, N_QUERIES)
+
+    failed = run(path, queries, tolerance=args.tolerance)
+    if failed:
+        sys.exit(f"recall@{K} below {1 - args.tolerance:.4f} for: {', '.join(failed)}")
+
+
+if __name__ == "__main__":
+    main()
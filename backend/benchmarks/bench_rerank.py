@@ -0,0 +1,116 @@
+"""
+Per-request CPU cost of the /get_context/ re-rank step.
+
+Compares the old loop (re-embed every candidate one at a time, then
+sklearn cosine_similarity over Python lists) with the vectorized path
+(stored embeddings + one NumPy matrix-vector product).
+
+Run inside the backend container after ingest:
+
+    python benchmarks/bench_rerank.py
+    python benchmarks/bench_rerank.py --synthetic 3000
+
+--synthetic searches a throwaway store built the way bench_startup.py
+builds one, with a hashing embedder in place of the ONNX model. Embedding
+is then nearly free, so the loop's numbers leave out the 30 model forward
+passes per request it pays in production; what remains is the per-call
+and sklearn overhead.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.chroma_store import ChromaStore
+from utils.retrieval import batched_query, fuse_query_results, embedding_similarities
+
+QUESTIONS = [
+    "Where can I eat breakfast?",
+    "What is on the Kay Kafe menu today?",
+    "Where do I park for my first visit?",
+    "What are the side effects of chemotherapy?",
+    "Is there family housing near the hospital?",
+    "How do I sign up for MyChart?",
+    "What are the signs of leukemia?",
+    "Can visitors stay overnight?",
+]
+QUERY_PREFIX = "query: "
+DOC_PREFIX = "passage: "
+K_CANDIDATES = 30
+ROUNDS = 5
+
+
+def rerank_loop(embedder, query_embed, candidates):
+    from sklearn.metrics.pairwise import cosine_similarity
+
+    docs = [f"{DOC_PREFIX}{c['document']}" for c in candidates]
+    doc_embeds = [embedder([doc])[0] for doc in docs]
+    return cosine_similarity([query_embed], doc_embeds)[0]
+
+
+def rerank_vectorized(embedder, query_embed, candidates):
+    return embedding_similarities(query_embed, candidates, embedder=embedder, doc_prefix=DOC_PREFIX)
+
+
+def measure(fn, embedder, prepared):
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    for _ in range(ROUNDS):
+        for query_embed, candidates in prepared:
+            fn(embedder, query_embed, [dict(c) for c in candidates])
+    n = ROUNDS * len(prepared)
+    cpu = (time.process_time() - cpu_start) / n
+    wall = (time.perf_counter() - wall_start) / n
+    return cpu * 1000, wall * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--synthetic", type=int, default=0, help="build a synthetic store with this many chunks")
+    args = parser.parse_args()
+
+    tmp = None
+    if args.synthetic:
+        from bench_startup import build_synthetic_store
+
+        tmp = tempfile.TemporaryDirectory()
+        build_synthetic_store(tmp.name, args.synthetic)
+        store = ChromaStore(path=tmp.name)
+    else:
+        store = ChromaStore()
+    store.open()
+    embedder = store.embedder
+
+    prepared = []
+    for question in QUESTIONS:
+        # embedded up front, as get_context does
+        query_embed = embedder([f"{QUERY_PREFIX}{question}"])[0]
+        results, _ = batched_query(
+            store.collection,
+            [f"{QUERY_PREFIX}{question}"],
+            query_embeddings=[query_embed],
+            n_results=K_CANDIDATES,
+            include=["documents", "distances", "embeddings"],
+        )
+        candidates = fuse_query_results(results)
+        prepared.append((query_embed, candidates))
+
+    # warm the ONNX session so neither side pays for model load
+    rerank_loop(embedder, *prepared[0])
+
+    print(f"{len(QUESTIONS)} questions x {ROUNDS} rounds, {K_CANDIDATES} candidates each")
+    print(f"{'mode':<12}{'cpu ms/req':>12}{'wall ms/req':>13}")
+    for name, fn in (("loop", rerank_loop), ("vectorized", rerank_vectorized)):
+        cpu, wall = measure(fn, embedder, prepared)
+        print(f"{name:<12}{cpu:>12.2f}{wall:>13.2f}")
+
+    store.close()
+    if tmp is not None:
+        tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Startup report for the API: import time, time to first /ready answer,
+time until retrieval is warm, and /get_context/ latency right after
+readiness compared with steady state.
+
+Run from the backend directory:
+
+    python benchmarks/bench_startup.py                  # store from ingest
+    python benchmarks/bench_startup.py --synthetic 6000
+
+--synthetic builds a throwaway Chroma store of random 384-dim vectors and
+swaps the ONNX model for a hashing embedder, for machines without the
+model download; the model-load share of warmup is then missing.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DIM = 384
+
+
+def _hashing_embedder():
+    from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+
+    class HashingEmbeddingFunction(DefaultEmbeddingFunction):
+        """Deterministic unit vectors from a hash of the text."""
+
+        def __init__(self):
+            pass
+
+        def __call__(self, input):
+            out = []
+            for text in input:
+                rng = np.random.default_rng(abs(hash(text)) % (2 ** 32))
+                v = rng.normal(size=DIM).astype(np.float32)
+                out.append(v / np.linalg.norm(v))
+            return out
+
+    return HashingEmbeddingFunction
+
+
+def build_synthetic_store(path, n):
+    import chromadb
+    import chromadb.utils.embedding_functions as embedding_functions
+
+    from utils.chroma_store import COLLECTION_NAME, write_index_version
+
+    embedder_cls = _hashing_embedder()
+    # ChromaStore builds DefaultEmbeddingFunction(); make that the hashing one
+    embedding_functions.DefaultEmbeddingFunction = embedder_cls
+
+    client = chromadb.PersistentClient(path=path)
+    collection = client.create_collection(name=COLLECTION_NAME, embedding_function=embedder_cls())
+    rng = np.random.default_rng(0)
+    for start in range(0, n, 1000):
+        stop = min(start + 1000, n)
+        vectors = rng.normal(size=(stop - start, DIM)).astype(np.float32)
+        collection.add(
+            ids=[f"chunk-{i}" for i in range(start, stop)],
+            documents=[f"synthetic chunk {i} about dining parking housing" for i in range(start, stop)],
+            metadatas=[{"section": f"section-{i % 20}"} for i in range(start, stop)],
+            embeddings=vectors / np.linalg.norm(vectors, axis=1, keepdims=True),
+        )
+    write_index_version(path)
+    # the API opens its own client
+    system = client._system
+    client.clear_system_cache()
+    system.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--synthetic", type=int, default=0, help="build a synthetic store with this many chunks")
+    parser.add_argument("--requests", type=int, default=30)
+    args = parser.parse_args()
+
+    tmp = None
+    if args.synthetic:
+        tmp = tempfile.TemporaryDirectory()
+        os.environ["CHROMA_PATH"] = tmp.name
+        build_synthetic_store(tmp.name, args.synthetic)
+        # keep the import measurement honest: main must not find chromadb preloaded
+        for name in [m for m in sys.modules if m.startswith("utils.")]:
+            del sys.modules[name]
+
+    start = time.perf_counter()
+    import main as api
+    import_s = time.perf_counter() - start
+
+    from fastapi.testclient import TestClient
+
+    questions = Path(__file__).with_name("questions.txt").read_text(encoding="utf-8").splitlines()
+    start = time.perf_counter()
+    with TestClient(api.app) as client:
+        serving_s = time.perf_counter() - start
+        t = time.perf_counter()
+        first_ready = client.get("/ready")
+        first_ready_ms = (time.perf_counter() - t) * 1000
+        while client.get("/ready").status_code != 200:
+            if api.startup_state["checks"].get("retrieval", "").startswith("error"):
+                sys.exit(f"warmup failed: {api.startup_state['checks']['retrieval']}")
+            time.sleep(0.01)
+        ready_s = time.perf_counter() - start
+
+        latencies = []
+        for question in questions[:args.requests]:
+            t = time.perf_counter()
+            response = client.post("/get_context/", json={"question": question})
+            latencies.append((time.perf_counter() - t) * 1000)
+            response.raise_for_status()
+
+    print(f"import main:              {import_s * 1000:8.1f} ms")
+    print(f"lifespan to serving:      {serving_s * 1000:8.1f} ms")
+    print(f"first /ready answer:      {first_ready_ms:8.1f} ms (status {first_ready.status_code})")
+    print(f"lifespan to ready:        {ready_s * 1000:8.1f} ms")
+    print(f"warmup timings:           {api.startup_state['timings']}")
+    print(f"first /get_context/:      {latencies[0]:8.1f} ms")
+    print(f"steady /get_context/ p50: {statistics.median(latencies[1:]):8.1f} ms over {len(latencies) - 1} requests")
+    if tmp is not None:
+        tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
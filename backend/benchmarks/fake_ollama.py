@@ -0,0 +1,72 @@
+"""
+A stand-in for Ollama's /api/generate, for trying /chat without a model.
+
+Streams a canned answer word by word as NDJSON, the way Ollama does with
+"stream": true, after a configurable time to first token. Point the
+backend at it with OLLAMA_URL:
+
+    python benchmarks/fake_ollama.py --port 11435 --first-token-ms 300 --token-ms 20
+    OLLAMA_URL=http://localhost:11435 uvicorn main:app
+"""
+
+import argparse
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ANSWER = (
+    "According to St. Jude's dining page, the Kay Kafe is open for breakfast, "
+    "lunch and dinner. Ask at the front desk if you need directions."
+)
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    first_token_ms = 300
+    token_ms = 20
+
+    def _chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        if self.path != "/api/generate":
+            self.send_error(404)
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        time.sleep(self.first_token_ms / 1000)
+        words = ANSWER.split(" ")
+        for i, word in enumerate(words):
+            token = word if i == 0 else f" {word}"
+            self._chunk((json.dumps({"model": request.get("model"), "response": token, "done": False}) + "\n").encode("utf-8"))
+            time.sleep(self.token_ms / 1000)
+        self._chunk((json.dumps({"model": request.get("model"), "response": "", "done": True}) + "\n").encode("utf-8"))
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--first-token-ms", type=int, default=300)
+    parser.add_argument("--token-ms", type=int, default=20)
+    args = parser.parse_args()
+
+    FakeOllamaHandler.first_token_ms = args.first_token_ms
+    FakeOllamaHandler.token_ms = args.token_ms
+    server = ThreadingHTTPServer(("0.0.0.0", args.port), FakeOllamaHandler)
+    print(f"Fake Ollama listening on http://localhost:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
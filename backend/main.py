@@ -1,28 +1,235 @@
+import time
+
+_import_started = time.perf_counter()
+
+import asyncio
+import queue
+import uuid
 from typing import Union
-from fastapi import FastAPI, File, UploadFile
-import chromadb
-from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
-from langchain.vectorstores.base import VectorStoreRetriever
-# from langchain.embeddings.base import Embeddings
-from utils.transcribe_offline_function import transcribe_file_offline
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
 import datetime
 from typing import List, Tuple, Dict, Any, Optional
-import re
-from sklearn.metrics.pairwise import cosine_similarity
+import numpy as np
 
 from fastapi import Form
 from dotenv import load_dotenv
 import os
-from fastapi.responses import JSONResponse
-from fastapi.staticfiles import StaticFiles
-from utils.tts import synthesize_text_to_wav, OUTPUT_DIR
-# resolve cors error from frontend
-from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from utils.tts import (
+    synthesize_text_to_wav,
+    synthesize_stream,
+    wav_header,
+    channel_ready,
+    get_voices,
+    audio_cache,
+    OUTPUT_DIR,
+)
+from utils.audio_cache import TTS_CACHE_EVICT_INTERVAL
+from utils.chroma_store import get_store
+from utils.speech_pool import speech_pool, SpeechBusy
+from utils.riva_channels import channel_manager
+from utils.streaming_asr import transcribe_stream
+from utils.audio_preprocess import preprocess_wav
+from utils.uploads import read_multipart_file, UploadTooLarge, BadUpload
+from utils.llm import OllamaClient, build_prompt, system_prompt, error_line
+from utils.metadata_filter import detect_metadata_filter
+from utils.query_expansion import expand_query_weighted, retrieval_load
+from utils.retrieval import (
+    batched_query,
+    fuse_query_results,
+    fill_missing_candidates,
+    embedding_similarities,
+)
 
 load_dotenv()
 NVAPI_BEARER_TOKEN = os.getenv("NVAPI_BEARER_TOKEN")
-app = FastAPI()
-app.mount("/audiofiles", StaticFiles(directory=OUTPUT_DIR), name="audiofiles")
+
+RIVA_SERVER = "grpc.nvcf.nvidia.com:443"
+TTS_FUNCTION_ID = "877104f7-e885-42b9-8de8-f6e4c6303969"
+ASR_FUNCTION_ID = "d3fe9151-442b-4204-a70d-5fcc597fd610"
+
+TTS_VOICE = "Magpie-Multilingual.EN-US.Mia"
+TTS_LANGUAGE = "en-US"
+TTS_SAMPLE_RATE = 44100
+# Opus only supports 8/12/16/24/48 kHz
+TTS_OPUS_SAMPLE_RATE = 48000
+# /tts output format when the client does not ask for one
+TTS_DEFAULT_FORMAT = os.getenv("TTS_DEFAULT_FORMAT", "wav")
+TTS_FORMATS = ("wav", "ogg")
+# content types for the cached files served from /audiofiles
+AUDIO_MEDIA_TYPES = {
+    ".wav": "audio/wav",
+    ".ogg": "audio/ogg; codecs=opus",
+    ".opus": "audio/ogg; codecs=opus",
+}
+
+# uploads larger than this are rejected while they stream in (~60s of 44.1kHz stereo)
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+# keep a copy of every upload for debugging; off by default
+SAVE_AUDIO_SAMPLES = os.getenv("SAVE_AUDIO_SAMPLES", "false").lower() in ("1", "true", "yes")
+AUDIO_SAMPLES_DIR = os.getenv("AUDIO_SAMPLES_DIR", "/app/audio_samples")
+# downmix, resample and silence-trim uploads before recognition
+ASR_PREPROCESS = os.getenv("ASR_PREPROCESS", "true").lower() in ("1", "true", "yes")
+
+WARMUP_QUESTION = "Where can I eat?"
+# a failed retrieval warmup (e.g. CHROMA_PATH not ingested yet) is retried,
+# doubling the wait from 1s up to this
+WARMUP_RETRY_MAX_S = float(os.getenv("WARMUP_RETRY_MAX_S", "30"))
+# optional file of frequent answers (one per line) synthesized at startup
+TTS_PREWARM_FILE = os.getenv("TTS_PREWARM_FILE")
+TTS_PREWARM_FORMATS = [f for f in os.getenv("TTS_PREWARM_FORMATS", "wav,ogg").split(",") if f in TTS_FORMATS]
+
+# filled in by warmup() and reported by /ready
+startup_state: Dict[str, Any] = {"ready": False, "timings": {}, "checks": {}}
+
+
+def _riva_metadata(function_id: str) -> List[List[str]]:
+    return [
+        ["function-id", function_id],
+        ["authorization", f"Bearer {NVAPI_BEARER_TOKEN}"],
+    ]
+
+
+def _warmup_retrieval(app: FastAPI) -> None:
+    timings = startup_state["timings"]
+
+    # creating the store imports chromadb and builds the embedder, so it
+    # happens here rather than in lifespan, which would delay serving /ready
+    start = time.perf_counter()
+    store = get_store()
+    app.state.chroma_store = store
+    timings["create_store_s"] = round(time.perf_counter() - start, 3)
+
+    start = time.perf_counter()
+    store.open()
+    timings["open_store_s"] = round(time.perf_counter() - start, 3)
+
+    # first call loads the ONNX model behind DefaultEmbeddingFunction
+    start = time.perf_counter()
+    query_embed = store.embedder([f"query: {WARMUP_QUESTION}"])[0]
+    timings["embedding_model_s"] = round(time.perf_counter() - start, 3)
+
+    start = time.perf_counter()
+    store.retriever.query(query_embeddings=[query_embed], n_results=1, include=["documents"])
+    timings["warmup_query_s"] = round(time.perf_counter() - start, 3)
+
+
+def _warmup_speech() -> None:
+    checks = startup_state["checks"]
+    if not NVAPI_BEARER_TOKEN:
+        checks["tts"] = checks["asr"] = "skipped (no NVAPI_BEARER_TOKEN)"
+        return
+
+    start = time.perf_counter()
+    # importing the ASR helper pulls in riva/grpc, keep that off the import path too
+    import utils.transcribe_offline_function  # noqa: F401
+    for name, function_id in (("tts", TTS_FUNCTION_ID), ("asr", ASR_FUNCTION_ID)):
+        try:
+            ok = channel_ready(RIVA_SERVER, use_ssl=True, metadata=_riva_metadata(function_id))
+            checks[name] = "ok" if ok else "unreachable"
+        except Exception as e:
+            checks[name] = f"error: {e}"
+    startup_state["timings"]["speech_check_s"] = round(time.perf_counter() - start, 3)
+
+    if TTS_PREWARM_FILE and checks["tts"] == "ok":
+        _prewarm_tts(TTS_PREWARM_FILE)
+
+
+def _synthesize(text: str, audio_format: str = TTS_DEFAULT_FORMAT):
+    opus = audio_format == "ogg"
+    return synthesize_text_to_wav(
+        text=text,
+        server=RIVA_SERVER,
+        voice=TTS_VOICE,
+        language_code=TTS_LANGUAGE,
+        sample_rate_hz=TTS_OPUS_SAMPLE_RATE if opus else TTS_SAMPLE_RATE,
+        encoding="OGGOPUS" if opus else "LINEAR_PCM",
+        metadata=_riva_metadata(TTS_FUNCTION_ID),
+        use_ssl=True,
+    )
+
+
+def _prewarm_tts(path: str) -> None:
+    start = time.perf_counter()
+    try:
+        with open(path, encoding="utf-8") as fh:
+            phrases = [line.strip() for line in fh if line.strip()]
+    except OSError as e:
+        print(f"Could not read {path}: {e}")
+        return
+    for phrase in phrases:
+        try:
+            for audio_format in TTS_PREWARM_FORMATS:
+                _synthesize(phrase, audio_format)
+        except Exception as e:
+            print(f"TTS prewarm failed for {phrase!r}: {e}")
+    startup_state["timings"]["tts_prewarm_s"] = round(time.perf_counter() - start, 3)
+    startup_state["checks"]["tts_prewarm"] = f"{len(phrases)} phrases"
+
+
+async def warmup(app: FastAPI) -> None:
+    """
+    Loads everything the first request would otherwise pay for, then flips /ready.
+
+    Retrieval has to be warm for the service to be ready, and its warmup is
+    retried until it is: the API can start before the first ingest has
+    written the store. The speech channel checks are reported but do not
+    block readiness, so retrieval still serves when the speech backend is
+    down.
+    """
+    started = time.perf_counter()
+    delay = 1.0
+    attempt = 1
+    while True:
+        try:
+            await asyncio.to_thread(_warmup_retrieval, app)
+            break
+        except Exception as e:
+            startup_state["checks"]["retrieval"] = f"error: {e} (attempt {attempt}, retrying in {delay:g}s)"
+            print(f"Retrieval warmup failed (attempt {attempt}), retrying in {delay:g}s: {e}")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, WARMUP_RETRY_MAX_S)
+        attempt += 1
+    startup_state["ready"] = True
+    startup_state["checks"]["retrieval"] = "ok"
+    startup_state["timings"]["ready_after_s"] = round(time.perf_counter() - started, 3)
+    await asyncio.to_thread(_warmup_speech)
+
+
+async def evict_audio_cache() -> None:
+    while True:
+        try:
+            deleted = await asyncio.to_thread(audio_cache.evict)
+            if deleted:
+                print(f"Evicted {deleted} cached audio files")
+        except Exception as e:
+            print(f"Audio cache eviction failed: {e}")
+        await asyncio.sleep(TTS_CACHE_EVICT_INTERVAL)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # one vector store for the whole process instead of one per request;
+    # it is created, opened and warmed in the background so the server can
+    # answer /ready (with 503) while the model loads
+    app.state.chroma_store = None
+    # one pooled HTTP client to Ollama for every /chat request
+    app.state.llm = OllamaClient()
+    warmup_task = asyncio.create_task(warmup(app))
+    eviction_task = asyncio.create_task(evict_audio_cache())
+    yield
+    warmup_task.cancel()
+    eviction_task.cancel()
+    speech_pool.shutdown()
+    channel_manager.close()
+    if app.state.chroma_store is not None:
+        app.state.chroma_store.close()
+    await app.state.llm.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
+startup_state["timings"]["import_s"] = round(time.perf_counter() - _import_started, 3)
 
 # resolve cors error from frontend
 from fastapi.middleware.cors import CORSMiddleware
@@ -39,25 +246,34 @@ app.add_middleware(
 async def read_root():
     return {"Hello": "World"}
 
+
+def _not_ready() -> JSONResponse:
+    # retrieval handlers answer this until warmup has opened the store, so a
+    # request never waits on the store lock that warmup holds
+    return JSONResponse(
+        content={"error": "Retrieval is still warming up"},
+        status_code=503,
+        headers={"Retry-After": "5"},
+    )
+
+
+@app.get("/ready")
+async def ready():
+    status_code = 200 if startup_state["ready"] else 503
+    return JSONResponse(content=startup_state, status_code=status_code)
+
+
 @app.post("/tts")
 async def synthesize(
     text: str = Form(...),
-    text_id: Union[str, None] = Form(None)
+    text_id: Union[str, None] = Form(None),
+    audio_format: str = Form(TTS_DEFAULT_FORMAT, alias="format"),
 ):
+    if audio_format not in TTS_FORMATS:
+        return JSONResponse(content={"error": f"format must be one of {', '.join(TTS_FORMATS)}"}, status_code=400)
     try:
-        result = synthesize_text_to_wav(
-            text=text,
-            server="grpc.nvcf.nvidia.com:443",
-            voice="Magpie-Multilingual.EN-US.Mia",
-            language_code="en-US",
-            sample_rate_hz=44100,
-            encoding="LINEAR_PCM",
-             metadata=[
-                ["function-id", "877104f7-e885-42b9-8de8-f6e4c6303969"],
-                ["authorization", f"Bearer {NVAPI_BEARER_TOKEN}"]
-            ],
-            use_ssl=True,
-        )
+        # the riva client blocks, so it runs in the speech pool
+        result = await speech_pool.run("tts", _synthesize, text, audio_format)
 
         # Build public URL (relative)
         # file_url = f"/files/{Path(file_path).name}"
@@ -87,160 +303,319 @@ async def synthesize(
         #     result_dict = str(result)
         return JSONResponse(content={"audio_path": result[0], "audio_id": text_id}, status_code=200)
 
+    except SpeechBusy as e:
+        return JSONResponse(content={"error": str(e)}, status_code=504)
     except Exception as e:
         return JSONResponse(content={"error": str(e)}, status_code=500)
     
     # return {"message": "This is text to audio endpoint"}
 
-# post endpoint with /get_context/ which will have question from forntend
-@app.post("/get_context/")
-async def get_context(request: dict):
-    question = request.get("question")
-    expanded_queries = expand_query(question)
-    metadata_filter = detect_metadata_filter(question)
-    query_prefix: str = "query: "
-    chroma_client = chromadb.PersistentClient(path="/app/chroma/.")
-    collection = chroma_client.get_collection(name="jude-e-documents")
-
-    # get top 5 chunks from collection based on question
-    top_5_chunks = collection.query(query_texts=[question], n_results=5)
-    documents = top_5_chunks['documents']
-    distances = top_5_chunks['distances']
-    # for now just return the question
-    return {"question": question, "documents": documents, "distances": distances}
-
-    # db_retriever: VectorStoreRetriever = chromadb.PersistentClient(path="/app/chroma/.").get_collection(name="jude-e-documents").as_retriever()
-    # embedder = chromadb.utils.embedding_functions.SentenceTransformerEmbeddingFunction(model_name="all-MiniLM-L6-v2")
-    embedder = DefaultEmbeddingFunction()
-    k_docs: int = 10  # Increased from 5
-    # lambda_mult: float = 0.3  # Lower for more similarity focus
-    query_prefix: str = "query: ",
-    doc_prefix: str = "passage: "
 
-     # Step 3: Retrieve documents for each expanded query with metadata filter
-    all_retrieved_docs = []
-
-    for exp_query in expanded_queries:
-        formatted_query = f"{query_prefix}{exp_query}"
+@app.get("/audiofiles/{name}")
+async def audio_file(name: str):
+    # replaces the StaticFiles mount: explicit audio content types and
+    # Range support, so playback starts before the download finishes
+    # (Starlette's FileResponse answers Range requests itself since 0.39)
+    path = OUTPUT_DIR / name
+    if path.name != name or name.startswith(".") or not path.is_file():
+        return JSONResponse(content={"error": "Not found"}, status_code=404)
+    return FileResponse(
+        path,
+        media_type=AUDIO_MEDIA_TYPES.get(path.suffix, "application/octet-stream"),
+        # content-addressed, so a name never changes meaning
+        headers={"Cache-Control": "public, max-age=31536000, immutable"},
+    )
+
+
+@app.get("/tts/stream")
+async def synthesize_streaming(text: str):
+    """
+    Streams the spoken answer as a WAV of unknown length, sentence by
+    sentence, so playback can start after the first sentence. A GET, so the
+    URL can be handed straight to an <audio> element.
+    """
+    chunks = speech_pool.stream(
+        "tts",
+        synthesize_stream,
+        text,
+        server=RIVA_SERVER,
+        voice=TTS_VOICE,
+        language_code=TTS_LANGUAGE,
+        sample_rate_hz=TTS_SAMPLE_RATE,
+        metadata=_riva_metadata(TTS_FUNCTION_ID),
+        use_ssl=True,
+    )
+    try:
+        # wait for the first chunk so errors still get a proper status code
+        first = await chunks.__anext__()
+    except StopAsyncIteration:
+        return JSONResponse(content={"error": "No audio synthesized"}, status_code=500)
+    except SpeechBusy as e:
+        return JSONResponse(content={"error": str(e)}, status_code=504)
+    except Exception as e:
+        return JSONResponse(content={"error": str(e)}, status_code=500)
 
-        # # Define retriever method
-        # retriever = db_retriever.query()
+    async def body():
+        yield wav_header(TTS_SAMPLE_RATE)
+        yield first
+        try:
+            async for chunk in chunks:
+                yield chunk
+        except Exception as e:
+            # headers are already sent; end the stream early
+            print(f"TTS stream failed: {e}")
+        finally:
+            await chunks.aclose()
 
-        # Get relevant documents
-        results = collection.query(
-            query_texts=[formatted_query],
-            n_results=k_docs,
-            where=metadata_filter
-        )['documents'][0]
+    return StreamingResponse(body(), media_type="audio/wav")
 
-        # Store documents with their expanded query context
-        for doc in results:
-            all_retrieved_docs.append((doc, exp_query))
 
-    # Step 3: Remove duplicates while preserving order
-    seen_docs = set()
-    unique_docs = []
-    for doc_content, exp_query in all_retrieved_docs:
-        if doc_content not in seen_docs:
-            seen_docs.add(doc_content)
-            unique_docs.append((doc_content, exp_query))
+@app.get("/voices")
+async def voices(refresh: bool = False):
+    try:
+        catalog = await speech_pool.run(
+            "tts",
+            get_voices,
+            server=RIVA_SERVER,
+            use_ssl=True,
+            metadata=_riva_metadata(TTS_FUNCTION_ID),
+            refresh=refresh,
+        )
+        return {"voices": catalog}
+    except SpeechBusy as e:
+        return JSONResponse(content={"error": str(e)}, status_code=504)
+    except Exception as e:
+        return JSONResponse(content={"error": str(e)}, status_code=500)
 
-    # Step 4: Re-rank all unique documents against original query
-    original_formatted_query = f"{query_prefix}{question}"
-    # query_embed = embedder.embed_query(original_formatted_query)
-    query_embed = embedder([original_formatted_query])[0]
 
-    # Format documents for embedding
-    formatted_retrieved_docs = [f"{doc_prefix}{doc}" for doc, _ in unique_docs]
+def retrieve_context(question: str) -> Dict[str, Any]:
+    """
+    Retrieval for one question: {"question", "documents", "distances"},
+    shared by /get_context/ and /chat.
+    """
+    with retrieval_load.track():
+        return _retrieve_context(question)
 
-    # Embed documents
-    # doc_embeds = embedder.embed_documents(formatted_retrieved_docs)
-    doc_embeds = [embedder([doc])[0] for doc in formatted_retrieved_docs]
 
-    # Compute similarity scores
-    similarity_scores = cosine_similarity([query_embed], doc_embeds)[0]
+def _retrieve_context(question: str) -> Dict[str, Any]:
+    metadata_filter = detect_metadata_filter(question)
+    store = app.state.chroma_store
+    # section-scoped questions go straight to their shard when one exists
+    collection, search_filter = store.route(metadata_filter)
+    embedder = store.embedder
+    query_embedder = store.query_embedder
+
+    k_docs: int = 10
+    # how many fused candidates make it into the re-rank step
+    k_candidates: int = 3 * k_docs
+    # RRF weight of the BM25 ranking, and max score boost for lexical matches
+    lexical_weight: float = 1.0
+    lexical_boost: float = 0.2
+    query_prefix: str = "query: "
+    doc_prefix: str = "passage: "
 
-    # Step 5: Combine documents with scores and rank
-    ranked_docs = []
-    for i, (formatted_doc, score) in enumerate(zip(formatted_retrieved_docs, similarity_scores)):
-        original_doc, exp_query = unique_docs[i]
-        ranked_docs.append((formatted_doc, score, exp_query))
+    # Step 0: Serve paraphrases of recently answered questions from the
+    # result cache. Query embeddings come from the LRU cache, so repeated
+    # questions skip the model forward pass.
+    query_embed = query_embedder([f"{query_prefix}{question}"])[0]
+    cached = store.result_cache.get(question, metadata_filter, query_embed, version=store.version)
+    if cached is not None:
+        return {"question": question, **cached}
+
+    # Step 1: Retrieve for every expanded query in one batched search;
+    # fewer variants when many retrievals are running at once
+    max_expansions, min_weight = retrieval_load.limits()
+    expanded = expand_query_weighted(question, max_expansions, min_weight)
+    expanded_queries = [q for q, _ in expanded]
+    formatted_queries = [f"{query_prefix}{q}" for q in expanded_queries]
+    query_embeddings = query_embedder(formatted_queries)
+    results, applied_filter = batched_query(
+        collection,
+        formatted_queries,
+        query_embeddings=query_embeddings,
+        n_results=k_docs,
+        where=search_filter,
+        include=["documents", "distances", "embeddings"],
+        # small sections (and their shards) are topped up from the whole corpus
+        fallback=store.retriever,
+    )
+
+    # Lexical retrieval over the BM25 index built at ingest, side by side
+    # with the dense search; exact names like "Kay Kafe" rank well here.
+    bm25 = store.bm25
+    lexical_ranked_ids = []
+    if bm25 is not None:
+        lexical_scores = bm25.scores(question)
+        # rank within the filter's rows only, like the dense search (routed to a shard or not)
+        lexical_rows = bm25.rows_for(metadata_filter)
+        lexical_ranked_ids = [[doc_id for doc_id, _ in bm25.top(lexical_scores, k_docs, rows=lexical_rows)]]
+
+    # Step 2: Merge the dense and lexical rankings with reciprocal rank fusion.
+    # The original question counts double so synonyms can only add recall,
+    # and closer synonyms count more than distant ones.
+    weights = [2.0] + [w for _, w in expanded[1:]] + [lexical_weight] * len(lexical_ranked_ids)
+    candidates = fuse_query_results(
+        results,
+        weights=weights,
+        limit=k_candidates,
+        extra_ranked_ids=lexical_ranked_ids,
+    )
+    candidates = fill_missing_candidates(collection, candidates, where=applied_filter)
+    if not candidates:
+        return {"question": question, "documents": [], "distances": []}
+
+    # Step 3: Re-rank the fused candidates against the original query using
+    # the vectors Chroma already stores instead of re-embedding every chunk
+    similarity_scores = embedding_similarities(
+        query_embed, candidates, embedder=embedder, doc_prefix=doc_prefix
+    )
+
+    # Step 4: Fuse in the lexical score, normalized to [0, 1] over the
+    # candidates, in place of the old per-request keyword overlap boost
+    if bm25 is not None:
+        lexical = np.array([bm25.score_of(lexical_scores, c["id"]) for c in candidates])
+        if lexical.max() > 0:
+            similarity_scores = similarity_scores + lexical_boost * lexical / lexical.max()
+
+    ranked_docs = [(c["document"], score) for c, score in zip(candidates, similarity_scores)]
 
-    # Sort by similarity score (descending)
     ranked_docs.sort(key=lambda x: x[1], reverse=True)
 
-    # # Step 6: Apply keyword boost for exact matches
-    boosted_docs = []
-    query_keywords = set(re.findall(r'\b\w+\b', question.lower()))
+    final_docs = [doc for doc, _ in ranked_docs[:k_docs]]
+    final_scores = [float(score) for _, score in ranked_docs[:k_docs]]  # numpy.float32 -> float
 
-    for doc, score, exp_query in ranked_docs:
-        doc_keywords = set(re.findall(r'\b\w+\b', doc.lower()))
-        keyword_overlap = len(query_keywords.intersection(doc_keywords))
+    print(f"Query: {question} | expanded to {len(expanded_queries)} queries | "
+          f"{len(candidates)} fused candidates")
 
-        # Boost score based on keyword overlap
-        boosted_score = score + (keyword_overlap * 0.05)  # Small boost for keyword matches
-        boosted_docs.append((doc, boosted_score, exp_query))
+    result = {"documents": final_docs, "distances": final_scores}
+    # a result narrowed by load shedding is not kept, so it is not served
+    # again once the load is gone
+    if (max_expansions, min_weight) == (retrieval_load.max_expansions, retrieval_load.min_weight):
+        store.result_cache.put(question, metadata_filter, query_embed, result, version=store.version)
+    return {"question": question, **result}
 
-    # # Final sort by boosted scores
-    boosted_docs.sort(key=lambda x: x[1], reverse=True)
 
-    # Display results
-    print("Query:", question)
-    print(f"\nExpanded to {len(expanded_queries)} queries")
-    print(f"Retrieved {len(unique_docs)} unique documents")
-    print(f"\nTop {k_docs} Retrieved Chunks with Scores:\n")
+# post endpoint with /get_context/ which will have question from forntend
+@app.post("/get_context/")
+async def get_context(request: dict):
+    if not startup_state["ready"]:
+        return _not_ready()
+    # embedding, search and BM25 block; keep them off the event loop so
+    # streaming responses and websockets keep flowing meanwhile
+    return await asyncio.to_thread(retrieve_context, request.get("question"))
 
-    final_docs = []
-    final_scores = []
-    for i, (doc, score, exp_query) in enumerate(boosted_docs[:k_docs]):
-        print(f"Chunk {i+1} (Score: {score:.4f}, From: '{exp_query}'):")
-        print(f"{doc}")
-        print(f"{'-'*80}")
-        final_docs.append(doc)
-        final_scores.append(float(score))  # Convert numpy.float32 to Python float
 
-    return {"question": question, "documents": final_docs, "distances": final_scores}
+@app.post("/chat")
+async def chat(request: dict):
+    """
+    Retrieval plus generation in one call: streams Ollama's NDJSON
+    ({"response": ...} per line) straight through to ChatBox, starting the
+    generation as soon as retrieval returns.
+    """
+    question = request.get("prompt")
+    if not question:
+        return JSONResponse(content={"error": "prompt is required"}, status_code=400)
+    if not startup_state["ready"]:
+        return _not_ready()
+    try:
+        context = await asyncio.to_thread(retrieve_context, question)
+    except Exception as e:
+        print(f"Retrieval failed: {e}")
+        return JSONResponse(content={"error": f"Retrieval failed: {e}"}, status_code=500)
+
+    llm = app.state.llm
+    prompt = build_prompt(question, context["documents"])
+    system = system_prompt(request.get("userRole"))
+
+    async def body():
+        try:
+            async for line in llm.generate_stream(prompt, system):
+                yield line
+        except Exception as e:
+            # the stream has started, so report the error in-band
+            print(f"Generation failed: {e}")
+            yield error_line("Sorry, I could not generate an answer right now.")
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+
+@app.get("/cache_stats")
+async def cache_stats():
+    if not startup_state["ready"]:
+        return _not_ready()
+    store = app.state.chroma_store
+    return {
+        "query_embeddings": store.query_embedder.cache.stats(),
+        "results": store.result_cache.stats(),
+        "speech": speech_pool.stats(),
+        "riva_channels": channel_manager.stats(),
+        "tts_audio": audio_cache.stats(),
+        "retrieval_load": retrieval_load.stats(),
+    }
+
+
+_background_tasks = set()
 
-    # chroma_client = chromadb.PersistentClient(path="/app/chroma/.")
-    # collection = chroma_client.get_collection(name="jude-e-documents")
-    # # get top 5 chunks from collection based on question
-    # top_5_chunks = collection.query(query_texts=[question], n_results=5)
-    # documents = top_5_chunks['documents']
-    # distances = top_5_chunks['distances']
-    # # for now just return the question
-    # return {"question": question, "documents": documents, "distances": distances}
+
+def _save_sample(content: bytes) -> None:
+    now = datetime.datetime.now()
+    date_time = now.strftime("%Y-%m-%d_%H-%M-%S")
+    # the uuid keeps two uploads in the same second apart
+    file_path = os.path.join(AUDIO_SAMPLES_DIR, f"temp{date_time}_{uuid.uuid4().hex[:8]}.wav")
+    with open(file_path, "wb") as f:
+        f.write(content)
+
+
+def save_sample_in_background(content: bytes) -> None:
+    task = asyncio.create_task(asyncio.to_thread(_save_sample, content))
+    # hold a reference until it is done, or the task may be garbage collected
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
 
 
 @app.post("/get_transcribe/")
-async def get_transcribe(file: UploadFile = File(...)):
-    # Check if file was uploaded
-    if not file:
+async def get_transcribe(request: Request):
+    # The "file" part is read straight off the request body, in memory and
+    # with the size limit applied while it streams in (no UploadFile, whose
+    # parser spools large parts to disk before the handler even runs)
+    try:
+        filename, file_content = await read_multipart_file(request, "file", MAX_UPLOAD_BYTES)
+    except UploadTooLarge:
+        return JSONResponse(content={"error": "Upload too large"}, status_code=413)
+    except BadUpload:
         return {"error": "No file uploaded"}
-    
+
     # Check if file is a wav file
-    if not file.filename.endswith('.wav'):
+    if not filename or not filename.endswith('.wav'):
         return {"error": "Only .wav files are supported"}
-    
+
     try:
-        # Read the file content
-        file_content = await file.read()
-        
-        # Save the file to audio_samples folder with date and time as name
-        now = datetime.datetime.now()
-        date_time = now.strftime("%Y-%m-%d_%H-%M-%S")
-        file_path = f"/app/audio_samples/temp{date_time}.wav"
-        
-        with open(file_path, "wb") as f:
-            f.write(file_content)
-
-        response = transcribe_file_offline(
-            input_file=file_path,
-            server="grpc.nvcf.nvidia.com:443",
+
+        if SAVE_AUDIO_SAMPLES:
+            save_sample_in_background(file_content)
+
+        audio_stats = None
+        if ASR_PREPROCESS:
+            try:
+                trimmed, audio_stats = await asyncio.to_thread(preprocess_wav, file_content)
+            except ValueError as e:
+                # not a WAV we can decode; let Riva have the original
+                print(f"Skipping audio preprocessing: {e}")
+            else:
+                print(f"Audio preprocessing: {audio_stats}")
+                if trimmed is None:
+                    return {"error": "No speech detected", "audio": audio_stats}
+                file_content = trimmed
+
+        from utils.transcribe_offline_function import transcribe_file_offline
+
+        response = await speech_pool.run(
+            "asr",
+            transcribe_file_offline,
+            input_file=file_content,
+            server=RIVA_SERVER,
             use_ssl=True,
-            metadata=[
-                ["function-id", "d3fe9151-442b-4204-a70d-5fcc597fd610"],
-                ["authorization", f"Bearer {NVAPI_BEARER_TOKEN}"]
-            ],
+            metadata=_riva_metadata(ASR_FUNCTION_ID),
             language_code="en-US",
             word_time_offsets=True,
             automatic_punctuation=True
@@ -250,254 +625,72 @@ async def get_transcribe(file: UploadFile = File(...)):
         if response and len(response.results) > 0:
             transcript = response.results[0].alternatives[0].transcript
             print(f"Transcript: {transcript}")
-            return {"transcript": transcript}
+            return {"transcript": transcript, "audio": audio_stats}
         else:
             return {"error": "No transcription results"}
-            
+
+    except SpeechBusy as e:
+        return JSONResponse(content={"error": str(e)}, status_code=504)
     except Exception as e:
         print(f"Error processing file: {e}")
         return {"error": f"Error processing file: {str(e)}"}
-    
-def expand_query(query: str) -> List[str]:
-    """Expand query with related terms for better retrieval"""
-    expansions = {
-        # Medical terms
-        "symptoms": ["signs", "indications", "early signs", "clinical features"],
-        "treatment": ["therapy", "management", "care", "intervention"],
-        "side effects": ["adverse effects", "toxicities", "complications"],
-        "diagnosis": ["testing", "screening", "evaluation"],
-        "prognosis": ["outlook", "survival", "recovery chances"],
-        "clinical trial": ["research study", "trial", "experimental therapy"],
-        # Cancer / disease
-        "cancer": ["tumor", "carcinoma", "malignancy", "oncology"],
-        "leukemia": ["blood cancer", "ALL", "AML"],
-        "lymphoma": ["hodgkin", "non-hodgkin"],
-        "infection": ["illness", "disease", "condition", "virus", "bacteria"],
-        # Resources
-        "meal": ["food", "nutrition", "dining", "cafeteria", "diet"],
-        "housing": ["lodging", "accommodation", "place to stay", "family housing"],
-        "transportation": ["shuttle", "travel", "ride", "commute", "bus service"],
-        "financial": ["cost", "expenses", "billing", "assistance", "funding"],
-        "support": ["counseling", "resources", "services", "help", "aid"],
-        "eat": ["restaurants", "menu"],
-        # Hospital / logistics
-        "admission": ["application", "check-in", "eligibility", "requirements"],
-        "visitor": ["guest", "family member", "parent", "guardian"],
-        "appointment": ["clinic visit", "consultation", "checkup", "follow-up"],
-    }
-
-    expanded_queries = [query]
-    query_lower = query.lower()
 
-    for key, synonyms in expansions.items():
-        if key in query_lower:
-            for synonym in synonyms:
-                expanded_queries.append(query.replace(key, synonym, 1))
 
-    return expanded_queries
-
-def detect_metadata_filter(query: str) -> Optional[Dict[str, Any]]:
-    """
-    Look for trigger phrases in the query and return an appropriate
-    metadata filter for your vector store.
+@app.websocket("/ws/transcribe")
+async def transcribe_websocket(websocket: WebSocket, sample_rate: int = 16000, language: str = "en-US"):
     """
-    q = query.lower()
-    # 2) detect_metadata_filter() dictionary
-    mapping = {
-        # --- St. Jude navigation & new patients ---
-        "new patient":      {"section": {"$eq": "Information for New Patients | St. Jude Care & Treatment"}},
-        "first visit":      {"section": {"$eq": "Information for New Patients | St. Jude Care & Treatment"}},
-    
-        # --- Housing ---
-        "housing":          {"section": {"$eq": "Housing and Patient Services - St. Jude Children’s Research Hospital"}},
-        "target house":     {"section": {"$eq": "Housing and Patient Services"}},
-        "tri delta":        {"section": {"$eq": "Housing and Patient Services"}},
-        "domino's village": {"section": {"$eq": "Domino's Village Menu"}},
-    
-        # --- Food services / menus ---
-        "kay kafe":         {"section": {"$eq": "Kay Kafe Menu"}},
-        "kay cafe":         {"section": {"$eq": "Kay Kafe Menu"}},
-        "room service":     {"section": {"$eq": "Room Service Menu - St. Jude Children’s Research Hospital"}},
-        "isolation":        {"section": {"$eq": "Isolation To-Go Menu - St. Jude Children’s Research Hospital"}},
-        "menu":             {"section": {"$eq": "Kay Kafe Menu"}},
-        # "eat":              {"section": {"$eq": "Kay Kafe Menu | Breakfast | Lunch | Dinner"}},
-    
-        # --- Logistics ---
-        "parking":          {"section": {"$eq": "Parking and Construction | St. Jude Care & Treatment"}},
-        "directions":       {"section": {"$eq": "Parking and Construction | St. Jude Care & Treatment"}},
-        "visitor":          {"section": {"$eq": "Visitors"}},
-    
-        # --- Patient portal & programs ---
-        "mychart":          {"section": {"$eq": "St. Jude MyChart"}},
-        "child life":       {"section": {"$eq": "Child Life | St. Jude Care & Treatment"}},
-        "school program":   {"section": {"$eq": "The St. Jude School Program | St. Jude Care & Treatment"}},
-    
-        # --- Clinical trials / research ---
-        "clinical trial":   {"section": {"$eq": "Clinical Trials | St. Jude Care & Treatment"}},
-        "consent":          {"section": {"$eq": "Understanding and signing consent forms"}},
-    
-        # --- Policies / legal ---
-        "hipaa":            {"title":   {"$eq": "Notice of Privacy Practices (HIPAA) - St. Jude Children’s Research Hospital"}},
-        "privacy":          {"section": {"$eq": "Privacy & Legal"}},
-        "nondiscrimination":{"section": {"$eq": "Discrimination is against the law"}},
-    
-        # --- Support services / community ---
-        "concierge":        {"section": {"$eq": "Best Upon Request Concierge Service\u202f | St. Jude Care & Treatment"}},
-        "st. jude voice":   {"section": {"$eq": "St. Jude Voice: Our Virtual Adviser community | St. Jude Care & Treatment"}},
-    
-        # --- Treatments ---
-        "chemotherapy":     {"section": {"$eq": "Chemotherapy"}},
-        "radiation":        {"section": {"$eq": "Radiation therapy"}},
-        "surgery":          {"section": {"$eq": "Surgery"}},
-        "targeted therapy": {"section": {"$eq": "Targeted therapy"}}
-}
+    Streaming recognition over a WebSocket.
 
-    # Regex-based mapping: if query contains both "eat" and "where"
-    PAIR_RULES: List[Tuple[re.Pattern, List[str]]] = [
-    # where + eat → any dining section
-    (re.compile(r"\b(?:where|location|find|near|place|available|open|closest|nearby|there)\b.*\b(?:eat|food|meal|dining|cafe|kafe|menu|restaurant|cafeteria|kitchen|snack|coffee)\b"
-    r"|"
-    r"\b(?:eat|food|meal|dining|cafe|kafe|menu|restaurant|cafeteria|kitchen|snack|coffee)\b.*\b(?:where|location|find|near|place|available|open|closest|nearby|there)\b", re.I),
-     ["Domino's Village Menu",
-     'Sunday',
-     'Breakfast',
-     'Lunch',
-     'Dinner',
-     'Saturday',
-     'Isolation To-Go Menu - St. Jude Children’s Research Hospital',
-     'Inpatient Room Service Daily Dinner Special',
-     'Friday',
-     'Monday',
-     'Tuesday',
-     'Wednesday',
-     'Thursday',
-     'Room Service Menu - St. Jude Children’s Research Hospital',
-     'Kay Kafe Menu',
-     'Meal Plans and Assistance - St. Jude Children’s Research Hospital',
-     'Snack Bags - St. Jude Children’s Research Hospital',
-     'Starbucks - St. Jude Children’s Research Hospital',
-     'Contact Us - St. Jude Children’s Research Hospital',
-     'Food on Campus'])
-]
-    # regex_mapping = [
-    #     (
-    #         re.compile(r"\bwhere\b.*\beat\b|\beat\b.*\bwhere\b"),
-    #         [
-    #             {"section": {"$eq": "Breakfast"}},
-    #             {"section": {"$eq": "Lunch"}},
-    #             {"section": {"$eq": "Dinner"}},
-    #         ]
-    #     )
-    # ]
-
-    for trigger, filt in mapping.items():
-        if trigger in q:
-            return filt
-
-    for pat, sections in PAIR_RULES:
-        if pat.search(query):
-            return {"section": {"$in": sections}}
-    return None
-
-def detect_metadata_filter(query: str) -> Optional[Dict[str, Any]]:
+    The client sends 16-bit mono PCM at `sample_rate` as binary frames and
+    the text frame "end" (or closes) when the user stops talking. The
+    server sends {"type": "interim"|"final", "transcript", "stability"}
+    messages as Riva produces them, then {"type": "done"}.
     """
-    Look for trigger phrases in the query and return an appropriate
-    metadata filter for your vector store.
-    """
-    q = query.lower()
-    # 2) detect_metadata_filter() dictionary
-    mapping = {
-        # --- St. Jude navigation & new patients ---
-        "new patient":      {"section": {"$eq": "Information for New Patients | St. Jude Care & Treatment"}},
-        "first visit":      {"section": {"$eq": "Information for New Patients | St. Jude Care & Treatment"}},
-    
-        # --- Housing ---
-        "housing":          {"section": {"$eq": "Housing and Patient Services - St. Jude Children’s Research Hospital"}},
-        "target house":     {"section": {"$eq": "Housing and Patient Services"}},
-        "tri delta":        {"section": {"$eq": "Housing and Patient Services"}},
-        "domino's village": {"section": {"$eq": "Domino's Village Menu"}},
-    
-        # --- Food services / menus ---
-        "kay kafe":         {"section": {"$eq": "Kay Kafe Menu"}},
-        "kay cafe":         {"section": {"$eq": "Kay Kafe Menu"}},
-        "room service":     {"section": {"$eq": "Room Service Menu - St. Jude Children’s Research Hospital"}},
-        "isolation":        {"section": {"$eq": "Isolation To-Go Menu - St. Jude Children’s Research Hospital"}},
-        "menu":             {"section": {"$eq": "Kay Kafe Menu"}},
-        # "eat":              {"section": {"$eq": "Kay Kafe Menu | Breakfast | Lunch | Dinner"}},
-    
-        # --- Logistics ---
-        "parking":          {"section": {"$eq": "Parking and Construction | St. Jude Care & Treatment"}},
-        "directions":       {"section": {"$eq": "Parking and Construction | St. Jude Care & Treatment"}},
-        "visitor":          {"section": {"$eq": "Visitors"}},
-    
-        # --- Patient portal & programs ---
-        "mychart":          {"section": {"$eq": "St. Jude MyChart"}},
-        "child life":       {"section": {"$eq": "Child Life | St. Jude Care & Treatment"}},
-        "school program":   {"section": {"$eq": "The St. Jude School Program | St. Jude Care & Treatment"}},
-    
-        # --- Clinical trials / research ---
-        "clinical trial":   {"section": {"$eq": "Clinical Trials | St. Jude Care & Treatment"}},
-        "consent":          {"section": {"$eq": "Understanding and signing consent forms"}},
-    
-        # --- Policies / legal ---
-        "hipaa":            {"title":   {"$eq": "Notice of Privacy Practices (HIPAA) - St. Jude Children’s Research Hospital"}},
-        "privacy":          {"section": {"$eq": "Privacy & Legal"}},
-        "nondiscrimination":{"section": {"$eq": "Discrimination is against the law"}},
-    
-        # --- Support services / community ---
-        "concierge":        {"section": {"$eq": "Best Upon Request Concierge Service\u202f | St. Jude Care & Treatment"}},
-        "st. jude voice":   {"section": {"$eq": "St. Jude Voice: Our Virtual Adviser community | St. Jude Care & Treatment"}},
-    
-        # --- Treatments ---
-        "chemotherapy":     {"section": {"$eq": "Chemotherapy"}},
-        "radiation":        {"section": {"$eq": "Radiation therapy"}},
-        "surgery":          {"section": {"$eq": "Surgery"}},
-        "targeted therapy": {"section": {"$eq": "Targeted therapy"}}
-}
-
-    # Regex-based mapping: if query contains both "eat" and "where"
-    PAIR_RULES: List[Tuple[re.Pattern, List[str]]] = [
-    # where + eat → any dining section
-    (re.compile(r"\b(?:where|location|find|near|place|available|open|closest|nearby|there)\b.*\b(?:eat|food|meal|dining|cafe|kafe|menu|restaurant|cafeteria|kitchen|snack|coffee)\b"
-    r"|"
-    r"\b(?:eat|food|meal|dining|cafe|kafe|menu|restaurant|cafeteria|kitchen|snack|coffee)\b.*\b(?:where|location|find|near|place|available|open|closest|nearby|there)\b", re.I),
-     ["Domino's Village Menu",
-     'Sunday',
-     'Breakfast',
-     'Lunch',
-     'Dinner',
-     'Saturday',
-     'Isolation To-Go Menu - St. Jude Children’s Research Hospital',
-     'Inpatient Room Service Daily Dinner Special',
-     'Friday',
-     'Monday',
-     'Tuesday',
-     'Wednesday',
-     'Thursday',
-     'Room Service Menu - St. Jude Children’s Research Hospital',
-     'Kay Kafe Menu',
-     'Meal Plans and Assistance - St. Jude Children’s Research Hospital',
-     'Snack Bags - St. Jude Children’s Research Hospital',
-     'Starbucks - St. Jude Children’s Research Hospital',
-     'Contact Us - St. Jude Children’s Research Hospital',
-     'Food on Campus'])
-]
-    # regex_mapping = [
-    #     (
-    #         re.compile(r"\bwhere\b.*\beat\b|\beat\b.*\bwhere\b"),
-    #         [
-    #             {"section": {"$eq": "Breakfast"}},
-    #             {"section": {"$eq": "Lunch"}},
-    #             {"section": {"$eq": "Dinner"}},
-    #         ]
-    #     )
-    # ]
-
-    for trigger, filt in mapping.items():
-        if trigger in q:
-            return filt
-
-    for pat, sections in PAIR_RULES:
-        if pat.search(query):
-            return {"section": {"$in": sections}}
-    return None
\ No newline at end of file
+    await websocket.accept()
+    # frames are handed to the recognizer thread through a queue; None ends the audio
+    frames: "queue.Queue[Optional[bytes]]" = queue.Queue()
+
+    async def receive_audio():
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message.get("bytes"):
+                    frames.put(message["bytes"])
+                elif message.get("text") == "end":
+                    break
+        except WebSocketDisconnect:
+            pass
+        finally:
+            frames.put(None)
+
+    receiver = asyncio.create_task(receive_audio())
+    try:
+        async for result in speech_pool.stream(
+            "asr",
+            transcribe_stream,
+            iter(frames.get, None),
+            server=RIVA_SERVER,
+            use_ssl=True,
+            metadata=_riva_metadata(ASR_FUNCTION_ID),
+            language_code=language,
+            sample_rate_hz=sample_rate,
+        ):
+            await websocket.send_json(result)
+        await websocket.send_json({"type": "done"})
+    except WebSocketDisconnect:
+        pass
+    except SpeechBusy as e:
+        await websocket.send_json({"type": "error", "error": str(e)})
+    except Exception as e:
+        print(f"Streaming transcription failed: {e}")
+        await websocket.send_json({"type": "error", "error": str(e)})
+    finally:
+        receiver.cancel()
+        # unblock the recognizer thread if it is still waiting for audio
+        frames.put(None)
+        try:
+            await websocket.close()
+        except RuntimeError:
+            pass  # already closed by the client
@@ -0,0 +1,110 @@
+"""
+Ingest tests on a small CSV, with a hashing embedder in place of the ONNX
+model. The embedders are module-level classes so spawned workers can
+unpickle them.
+"""
+
+import csv
+import hashlib
+import os
+import subprocess
+import sys
+import textwrap
+
+import numpy as np
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+from utils.create_chroma import ingest  # noqa: E402
+
+DIM = 384
+
+
+class HashingEmbedder:
+    """Deterministic unit vectors from a hash of the text."""
+
+    def __call__(self, input):
+        out = []
+        for text in input:
+            seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:4], "little")
+            v = np.random.default_rng(seed).normal(size=DIM).astype(np.float32)
+            out.append(v / np.linalg.norm(v))
+        return out
+
+
+class FailingEmbedder:
+    def __call__(self, input):
+        raise RuntimeError("embedder failed")
+
+
+def _metadata(title, section, retrieved_at):
+    return repr({
+        "source_url": "https://www.stjude.org/meals.html",
+        "retrieved_at": retrieved_at,
+        "title": title,
+        "section": section,
+        "super_section": None,
+    })
+
+
+def write_csv(data_dir, n_rows=80):
+    rows = [["id", "text", "metadata"]]
+    for i in range(n_rows):
+        rows.append([str(i), f"Menu item {i}\nServed daily", _metadata("Kay Kafe Menu", f"Day {i % 7}", "2025-09-29T20:03:40")])
+    # the same chunk scraped twice, seconds apart: only retrieved_at differs
+    rows.append([str(n_rows), "Kay Kafe Menu\nMonday", _metadata("Kay Kafe Menu", "Monday", "2025-09-29T20:03:41")])
+    rows.append([str(n_rows + 1), "Kay Kafe Menu\nMonday", _metadata("Kay Kafe Menu", "Monday", "2025-09-29T20:03:47")])
+    os.makedirs(data_dir, exist_ok=True)
+    with open(os.path.join(data_dir, "meals.csv"), "w", newline="", encoding="utf-8") as fh:
+        csv.writer(fh).writerows(rows)
+
+
+def run_ingest(data_dir, chroma_path):
+    return ingest(
+        data_dir,
+        chroma_path,
+        workers=2,
+        batch_size=16,
+        chunk_size=1000,
+        chunk_overlap=200,
+        embedding_function=HashingEmbedder,
+    )
+
+
+def test_reingest_of_unchanged_data_changes_nothing(tmp_path):
+    data_dir, chroma_path = str(tmp_path / "data"), str(tmp_path / "chroma")
+    write_csv(data_dir)
+
+    _, collection, changed = run_ingest(data_dir, chroma_path)
+    assert changed
+    first = collection.get(include=["metadatas"])
+    with open(os.path.join(chroma_path, "ingest_manifest.json"), encoding="utf-8") as fh:
+        manifest = fh.read()
+
+    for _ in range(2):
+        _, collection, changed = run_ingest(data_dir, chroma_path)
+        assert not changed
+        assert collection.get(include=["metadatas"]) == first
+        with open(os.path.join(chroma_path, "ingest_manifest.json"), encoding="utf-8") as fh:
+            assert fh.read() == manifest
+
+
+def test_worker_failure_exits_non_zero(tmp_path):
+    data_dir, chroma_path = str(tmp_path / "data"), str(tmp_path / "chroma")
+    write_csv(data_dir, n_rows=500)
+    script = textwrap.dedent(f"""
+        import sys
+        sys.path[:0] = [{BACKEND!r}, {os.path.dirname(os.path.abspath(__file__))!r}]
+        from test_create_chroma import FailingEmbedder
+        from utils.create_chroma import ingest
+        if __name__ == "__main__":
+            ingest({data_dir!r}, {chroma_path!r}, workers=2, batch_size=16, chunk_size=1000,
+                   chunk_overlap=200, embedding_function=FailingEmbedder)
+    """)
+    script_path = tmp_path / "run.py"
+    script_path.write_text(script, encoding="utf-8")
+    # used to hang in Pool.terminate() with the feeder thread blocked
+    result = subprocess.run([sys.executable, str(script_path)], capture_output=True, text=True, timeout=120)
+    assert result.returncode != 0
+    assert "embedder failed" in result.stderr
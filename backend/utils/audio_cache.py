@@ -0,0 +1,132 @@
+"""
+Content-addressed cache for synthesized audio.
+
+A file is named after a hash of everything that determines its bytes
+(text, voice, language, sample rate, encoding), so a repeated answer is
+served from disk without another synthesis RPC. A file's mtime is bumped on
+every hit, and the eviction pass deletes by age, then least recently used
+first until the directory fits its size budget.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Union
+
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+TTS_CACHE_MAX_AGE = float(os.getenv("TTS_CACHE_MAX_AGE", str(7 * 24 * 3600)))
+TTS_CACHE_EVICT_INTERVAL = float(os.getenv("TTS_CACHE_EVICT_INTERVAL", "600"))
+
+AUDIO_SUFFIXES = (".wav", ".ogg", ".opus")
+
+
+def audio_key(text: str, voice: str, language_code: str, sample_rate_hz: int, encoding: str) -> str:
+    spec = "\0".join((text, voice or "", language_code, str(sample_rate_hz), encoding))
+    return hashlib.sha256(spec.encode("utf-8")).hexdigest()[:32]
+
+
+class AudioCache:
+    """
+    Audio files under `directory`, keyed by audio_key, with single-flight creation.
+    """
+
+    def __init__(
+        self,
+        directory: Union[str, Path],
+        max_bytes: int = TTS_CACHE_MAX_BYTES,
+        max_age: float = TTS_CACHE_MAX_AGE,
+    ):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._key_locks: Dict[str, threading.Lock] = {}
+
+    def path_for(self, key: str, suffix: str = ".wav") -> Path:
+        return self.directory / f"{key}{suffix}"
+
+    def get(self, key: str, suffix: str = ".wav") -> Optional[Path]:
+        path = self.path_for(key, suffix)
+        try:
+            os.utime(path)  # mark as recently used
+        except FileNotFoundError:
+            return None
+        return path
+
+    def get_or_create(self, key: str, create: Callable[[Path], Any], suffix: str = ".wav") -> Path:
+        """
+        Returns the cached file for `key`, calling create(tmp_path) to write it on a miss.
+
+        Concurrent misses for the same key wait for the first one instead of
+        synthesizing the same audio again. The file is written to a temporary
+        name and renamed, so readers never see a partial file.
+        """
+        path = self.get(key, suffix)
+        if path is not None:
+            self.hits += 1
+            return path
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            path = self.get(key, suffix)
+            if path is not None:
+                self.hits += 1
+                return path
+            self.misses += 1
+            path = self.path_for(key, suffix)
+            tmp = path.with_name(f".{path.name}.{threading.get_ident()}.tmp")
+            try:
+                create(tmp)
+                os.replace(tmp, path)
+            finally:
+                if tmp.exists():
+                    tmp.unlink()
+                with self._lock:
+                    self._key_locks.pop(key, None)
+        return path
+
+    def evict(self) -> int:
+        """
+        Deletes files older than max_age, then the least recently used ones
+        until the directory is within max_bytes. Returns how many were deleted.
+        """
+        now = time.time()
+        files = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_file() or not entry.name.endswith(AUDIO_SUFFIXES) or entry.name.startswith("."):
+                continue
+            st = entry.stat()
+            files.append((st.st_mtime, st.st_size, entry.path))
+        files.sort()
+
+        total = sum(size for _, size, _ in files)
+        deleted = 0
+        for mtime, size, path in files:
+            if now - mtime <= self.max_age and total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            deleted += 1
+        self.evictions += deleted
+        return deleted
+
+    def stats(self) -> Dict[str, Any]:
+        files = [e for e in os.scandir(self.directory) if e.is_file() and e.name.endswith(AUDIO_SUFFIXES)]
+        return {
+            "files": len(files),
+            "bytes": sum(e.stat().st_size for e in files),
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,201 @@
+"""
+Shrinks uploaded WAVs before they are sent to the recognizer.
+
+Browser recordings arrive at 44.1/48 kHz, sometimes stereo, with silence
+before and after the utterance. The ASR model works at 16 kHz mono, so
+the rest of those bytes only add upload and recognition time. Everything
+here is plain NumPy:
+
+    parse the RIFF header -> downmix to mono -> low-pass + resample ->
+    trim leading/trailing silence with a frame-energy VAD -> 16-bit WAV
+"""
+
+import io
+import os
+import struct
+import wave
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+ASR_SAMPLE_RATE = int(os.getenv("ASR_SAMPLE_RATE", "16000"))
+
+VAD_FRAME_MS = 20
+# a frame is speech when it is this far above the noise floor...
+VAD_MARGIN_DB = 12.0
+# ...within this range of the loudest frame, and above an absolute floor
+VAD_RANGE_DB = 45.0
+VAD_FLOOR_DBFS = -60.0
+# the estimated noise floor is capped here: on push-to-talk clips with
+# little silence the quietest frames are soft speech, not noise
+VAD_NOISE_MAX_DBFS = -60.0
+# below this peak-to-floor range there is no clear silence to trim
+VAD_MIN_RANGE_DB = 20.0
+# audio kept around the detected speech so word edges are not clipped
+VAD_PADDING_MS = 200
+
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+def parse_wav(data: bytes) -> Tuple[np.ndarray, int]:
+    """
+    Decodes a PCM or float WAV into float32 samples of shape (frames, channels) in [-1, 1].
+
+    Walks the RIFF chunks itself rather than using the wave module, which
+    rejects float and WAVE_FORMAT_EXTENSIBLE files that browsers produce.
+    """
+    if len(data) < 12 or data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        raise ValueError("Not a RIFF/WAVE file")
+
+    fmt = None
+    samples = None
+    pos = 12
+    while pos + 8 <= len(data):
+        chunk_id, size = struct.unpack_from("<4sI", data, pos)
+        body = data[pos + 8:pos + 8 + size]
+        if chunk_id == b"fmt ":
+            if len(body) < 16:
+                raise ValueError("Truncated fmt chunk")
+            fmt = struct.unpack_from("<HHIIHH", body)
+            if fmt[0] == WAVE_FORMAT_EXTENSIBLE and len(body) >= 26:
+                # the real format tag is the first two bytes of the sub-format GUID
+                fmt = (struct.unpack_from("<H", body, 24)[0],) + fmt[1:]
+        elif chunk_id == b"data":
+            samples = body
+            break
+        pos += 8 + size + (size & 1)  # chunks are word aligned
+
+    if fmt is None or samples is None:
+        raise ValueError("WAV file has no fmt or data chunk")
+    format_tag, channels, sample_rate, _, _, bits = fmt
+    if channels < 1 or sample_rate < 1 or bits not in (8, 16, 24, 32):
+        raise ValueError(f"Invalid WAV header: {channels} channels, {sample_rate} Hz, {bits} bits")
+
+    width = bits // 8
+    usable = len(samples) - len(samples) % (width * channels)
+    samples = samples[:usable]
+    if format_tag == WAVE_FORMAT_IEEE_FLOAT and bits == 32:
+        audio = np.frombuffer(samples, dtype="<f4").astype(np.float32)
+    elif format_tag == WAVE_FORMAT_PCM and bits == 8:
+        audio = (np.frombuffer(samples, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif format_tag == WAVE_FORMAT_PCM and bits == 16:
+        audio = np.frombuffer(samples, dtype="<i2").astype(np.float32) / 32768.0
+    elif format_tag == WAVE_FORMAT_PCM and bits == 24:
+        raw = np.frombuffer(samples, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        ints = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+        ints = np.where(ints >= 1 << 23, ints - (1 << 24), ints)
+        audio = ints.astype(np.float32) / float(1 << 23)
+    elif format_tag == WAVE_FORMAT_PCM and bits == 32:
+        audio = np.frombuffer(samples, dtype="<i4").astype(np.float32) / float(1 << 31)
+    else:
+        raise ValueError(f"Unsupported WAV format {format_tag} with {bits} bits")
+
+    return audio.reshape(-1, channels), sample_rate
+
+
+def to_mono(audio: np.ndarray) -> np.ndarray:
+    return audio.mean(axis=1) if audio.ndim == 2 else audio
+
+
+def _lowpass_kernel(cutoff: float, taps: int = 63) -> np.ndarray:
+    """
+    Hamming-windowed sinc low-pass; cutoff is a fraction of the source rate.
+    """
+    n = np.arange(taps) - (taps - 1) / 2
+    kernel = 2 * cutoff * np.sinc(2 * cutoff * n) * np.hamming(taps)
+    return (kernel / kernel.sum()).astype(np.float32)
+
+
+def resample(audio: np.ndarray, src_rate: int, dst_rate: int) -> np.ndarray:
+    """
+    Resamples mono audio. Downsampling low-passes at the new Nyquist rate
+    first so high frequencies do not alias into the speech band; the
+    resampling itself is linear interpolation.
+    """
+    if src_rate == dst_rate or len(audio) == 0:
+        return audio
+    if dst_rate < src_rate:
+        audio = np.convolve(audio, _lowpass_kernel(0.5 * dst_rate / src_rate), mode="same")
+    n_out = int(round(len(audio) * dst_rate / src_rate))
+    positions = np.arange(n_out, dtype=np.float64) * (src_rate / dst_rate)
+    return np.interp(positions, np.arange(len(audio)), audio).astype(np.float32)
+
+
+def speech_bounds(audio: np.ndarray, sample_rate: int) -> Optional[Tuple[int, int]]:
+    """
+    (start, stop) sample indices of the speech in `audio`, padded by
+    VAD_PADDING_MS, or None when no frame looks like speech.
+    """
+    frame = max(1, sample_rate * VAD_FRAME_MS // 1000)
+    n_frames = len(audio) // frame
+    if n_frames == 0:
+        return None
+    frames = audio[:n_frames * frame].reshape(n_frames, frame)
+    energy_db = 10 * np.log10(np.mean(frames * frames, axis=1) + 1e-12)
+
+    # the quietest tenth of the frames approximates the background noise
+    noise_floor = np.percentile(energy_db, 10)
+    peak = energy_db.max()
+    if peak <= VAD_FLOOR_DBFS:
+        return None
+    if peak - noise_floor < VAD_MIN_RANGE_DB:
+        # speech (or noise) throughout; trimming would only cut words
+        return 0, len(audio)
+    noise_floor = min(noise_floor, VAD_NOISE_MAX_DBFS)
+    threshold = max(noise_floor + VAD_MARGIN_DB, peak - VAD_RANGE_DB, VAD_FLOOR_DBFS)
+    voiced = np.flatnonzero(energy_db > threshold)
+    if len(voiced) == 0:
+        return None
+
+    padding = sample_rate * VAD_PADDING_MS // 1000
+    start = max(0, voiced[0] * frame - padding)
+    stop = min(len(audio), (voiced[-1] + 1) * frame + padding)
+    return start, stop
+
+
+def encode_wav(audio: np.ndarray, sample_rate: int) -> bytes:
+    pcm = (np.clip(audio, -1.0, 1.0) * 32767).astype("<i2")
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as out_f:
+        out_f.setnchannels(1)
+        out_f.setsampwidth(2)
+        out_f.setframerate(sample_rate)
+        out_f.writeframes(pcm.tobytes())
+    return buffer.getvalue()
+
+
+def preprocess_wav(data: bytes, target_rate: int = ASR_SAMPLE_RATE) -> Tuple[Optional[bytes], Dict[str, Any]]:
+    """
+    Returns (wav_bytes, stats) with the audio as 16-bit mono at target_rate,
+    trimmed to the detected speech. wav_bytes is None when the recording
+    holds no speech at all.
+    """
+    audio, sample_rate = parse_wav(data)
+    channels = audio.shape[1]
+    input_seconds = len(audio) / sample_rate
+    audio = resample(to_mono(audio), sample_rate, target_rate)
+
+    bounds = speech_bounds(audio, target_rate)
+    stats: Dict[str, Any] = {
+        "input_bytes": len(data),
+        "input_sample_rate": sample_rate,
+        "input_channels": channels,
+        "input_seconds": round(input_seconds, 3),
+    }
+    if bounds is None:
+        stats.update({"output_bytes": 0, "output_seconds": 0.0, "trimmed_seconds": round(input_seconds, 3)})
+        return None, stats
+
+    start, stop = bounds
+    audio = audio[start:stop]
+    output = encode_wav(audio, target_rate)
+    output_seconds = len(audio) / target_rate
+    stats.update({
+        "output_bytes": len(output),
+        "output_sample_rate": target_rate,
+        "output_seconds": round(output_seconds, 3),
+        "trimmed_seconds": round(input_seconds - output_seconds, 3),
+    })
+    return output, stats
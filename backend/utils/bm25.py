@@ -0,0 +1,197 @@
+"""
+BM25 inverted index over the chunks in the Chroma collection.
+
+utils/create_chroma.py builds it at ingest and saves it next to the Chroma
+store; the API loads it once together with the collection, so requests
+never tokenize documents. The filterable metadata fields are saved with it,
+so a section filter restricts the ranking to that section's rows the same
+way FlatIndex does.
+"""
+
+import json
+import math
+import os
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+from utils.flat_index import MASKED_FIELDS, RowMasks
+
+BM25_FILE = "bm25.json"
+
+_TOKEN = re.compile(r"\b\w+\b")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+
+class BM25Index:
+    """
+    Postings lists plus the statistics needed for Okapi BM25 scoring.
+    """
+
+    def __init__(
+        self,
+        ids: List[str],
+        doc_lengths: List[int],
+        postings: Dict[str, List[Tuple[int, int]]],
+        k1: float = 1.5,
+        b: float = 0.75,
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+    ):
+        self.ids = ids
+        self.positions = {doc_id: i for i, doc_id in enumerate(ids)}
+        self.k1 = k1
+        self.b = b
+        self.doc_lengths = np.asarray(doc_lengths, dtype=np.float32)
+        self.n_docs = len(ids)
+        self.avg_doc_length = float(self.doc_lengths.mean()) if self.n_docs else 0.0
+
+        # per-document length normalization, computed once
+        if self.n_docs:
+            self._norm = k1 * (1 - b + b * self.doc_lengths / self.avg_doc_length)
+        else:
+            self._norm = self.doc_lengths
+
+        self._postings: Dict[str, Tuple[np.ndarray, np.ndarray, float]] = {}
+        for term, plist in postings.items():
+            docs = np.fromiter((d for d, _ in plist), dtype=np.int32, count=len(plist))
+            tfs = np.fromiter((tf for _, tf in plist), dtype=np.float32, count=len(plist))
+            df = len(plist)
+            idf = math.log(1 + (self.n_docs - df + 0.5) / (df + 0.5))
+            self._postings[term] = (docs, tfs, idf)
+        self.n_terms = len(self._postings)
+
+        self.metadatas: Optional[List[Dict[str, Any]]] = None
+        self._masks: Optional[RowMasks] = None
+        if metadatas is not None:
+            self.set_metadatas(metadatas)
+
+    def set_metadatas(self, metadatas: List[Dict[str, Any]]) -> None:
+        """
+        Attaches the filterable metadata of each document, in `ids` order.
+        """
+        if len(metadatas) != self.n_docs:
+            raise ValueError(f"Expected {self.n_docs} metadatas, got {len(metadatas)}")
+        self.metadatas = [
+            {field: m[field] for field in MASKED_FIELDS if m and m.get(field) is not None}
+            for m in metadatas
+        ]
+        self._masks = RowMasks(self.metadatas)
+
+    def rows_for(self, where: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """
+        Row indices matching a metadata filter, or None for "all rows".
+        """
+        if not where:
+            return None
+        if self._masks is None:
+            raise ValueError("BM25 index was loaded without metadata, cannot filter")
+        return self._masks.rows_for(where)
+
+    @classmethod
+    def build(
+        cls,
+        ids: Iterable[str],
+        documents: Iterable[str],
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+        k1: float = 1.5,
+        b: float = 0.75,
+    ) -> "BM25Index":
+        ids = list(ids)
+        doc_lengths: List[int] = []
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        for doc_idx, doc in enumerate(documents):
+            tokens = tokenize(doc)
+            doc_lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                postings.setdefault(term, []).append((doc_idx, tf))
+        return cls(ids, doc_lengths, postings, k1=k1, b=b, metadatas=metadatas)
+
+    def save(self, path: Union[str, Path]) -> None:
+        data = {
+            "k1": self.k1,
+            "b": self.b,
+            "ids": self.ids,
+            "doc_lengths": self.doc_lengths.astype(int).tolist(),
+            "postings": {
+                term: [[int(d), int(tf)] for d, tf in zip(docs, tfs)]
+                for term, (docs, tfs, _) in self._postings.items()
+            },
+        }
+        if self.metadatas is not None:
+            data["metadatas"] = self.metadatas
+        path = Path(path)
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(data, fh, separators=(",", ":"))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "BM25Index":
+        with open(path, encoding="utf-8") as fh:
+            data = json.load(fh)
+        return cls(
+            data["ids"], data["doc_lengths"], data["postings"],
+            k1=data["k1"], b=data["b"], metadatas=data.get("metadatas"),
+        )
+
+    def scores(self, query: str) -> np.ndarray:
+        """
+        BM25 score of every document for `query` (zeros for documents sharing no term).
+        """
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        for term in set(tokenize(query)):
+            entry = self._postings.get(term)
+            if entry is None:
+                continue
+            docs, tfs, idf = entry
+            # doc indices are unique within a postings list, so plain += is safe
+            scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + self._norm[docs])
+        return scores
+
+    def score_of(self, scores: np.ndarray, doc_id: str) -> float:
+        """
+        Looks up one document's entry in an array returned by `scores`.
+        """
+        idx = self.positions.get(doc_id)
+        return float(scores[idx]) if idx is not None else 0.0
+
+    def search(self, query: str, k: int = 10, where: Optional[Dict[str, Any]] = None) -> List[Tuple[str, float]]:
+        """
+        Top-k (id, score) pairs for `query`, best first.
+        """
+        return self.top(self.scores(query), k, rows=self.rows_for(where))
+
+    def top(self, scores: np.ndarray, k: int = 10, rows: Optional[np.ndarray] = None) -> List[Tuple[str, float]]:
+        """
+        Top-k (id, score) pairs from an array returned by `scores`, best first.
+
+        `rows` (from `rows_for`) limits the ranking to those documents.
+        """
+        if rows is None:
+            nonzero = np.flatnonzero(scores)
+        else:
+            nonzero = rows[scores[rows] != 0]
+        if nonzero.size == 0:
+            return []
+        if nonzero.size > k:
+            top = nonzero[np.argpartition(-scores[nonzero], k - 1)[:k]]
+        else:
+            top = nonzero
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[i], float(scores[i])) for i in top]
+
+
+def load_bm25(chroma_path: Union[str, Path]) -> Optional[BM25Index]:
+    """
+    Loads the index saved next to the Chroma store, or None if ingest did not write one.
+    """
+    path = Path(chroma_path) / BM25_FILE
+    if not path.is_file():
+        return None
+    return BM25Index.load(path)
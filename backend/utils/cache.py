@@ -0,0 +1,260 @@
+"""
+In-process caches used by the API.
+"""
+
+import json
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """
+    Cache-key normalization for questions: lowercase, trimmed, single spaces.
+
+    The MiniLM tokenizer behind DefaultEmbeddingFunction is uncased, so this
+    never changes the embedding of the text.
+    """
+    return _WHITESPACE.sub(" ", text.strip().lower())
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache with a size limit, an optional TTL and hit/miss counters.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            stored_at, value = entry
+            if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+class CachedEmbeddingFunction:
+    """
+    Wraps an embedding function with an LRU cache keyed on normalized text.
+
+    Only the texts that miss the cache are sent to the wrapped function, in
+    one batch, so repeated questions skip the model forward pass entirely.
+    """
+
+    def __init__(self, embedder, max_size: int = 1024, ttl: Optional[float] = None):
+        self.embedder = embedder
+        self.cache = LRUCache(max_size=max_size, ttl=ttl)
+
+    def __call__(self, input: List[str]) -> List[Any]:
+        keys = [normalize_text(text) for text in input]
+        vectors: List[Any] = [self.cache.get(key) for key in keys]
+
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            fresh = self.embedder([input[i] for i in missing])
+            for i, vector in zip(missing, fresh):
+                vectors[i] = vector
+                self.cache.put(keys[i], vector)
+        return vectors
+
+
+def _approx_size(value: Any) -> int:
+    """
+    Rough byte size of a cached retrieval result (strings, numbers, lists, dicts).
+    """
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_approx_size(k) + _approx_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(_approx_size(v) for v in value)
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    return sys.getsizeof(value)
+
+
+class SemanticCache:
+    """
+    Retrieval-result cache keyed on (normalized question, metadata filter).
+
+    Besides exact matches it also hits when a cached question with the same
+    filter has a query embedding within `threshold` cosine similarity, so
+    paraphrases of the same intent share one result. Every entry is tagged
+    with the index version it was computed against; a lookup with a
+    different version drops the whole cache. Entries are evicted LRU-first
+    once either `max_entries` or `max_bytes` is exceeded.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.95,
+        max_entries: int = 512,
+        max_bytes: int = 32 * 1024 * 1024,
+    ):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.version: Optional[str] = None
+
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+        # key -> (filter_key, unit query vector, value, nbytes)
+        self._data: "OrderedDict[Tuple[str, str], tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _filter_key(metadata_filter: Optional[Dict[str, Any]]) -> str:
+        return json.dumps(metadata_filter, sort_keys=True, ensure_ascii=False)
+
+    @staticmethod
+    def _unit(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _check_version(self, version: str) -> None:
+        if version != self.version:
+            if self._data:
+                self.invalidations += 1
+            self._data.clear()
+            self._bytes = 0
+            self.version = version
+
+    def get(
+        self,
+        question: str,
+        metadata_filter: Optional[Dict[str, Any]],
+        embedding,
+        version: str,
+    ) -> Optional[Any]:
+        filter_key = self._filter_key(metadata_filter)
+        key = (normalize_text(question), filter_key)
+        with self._lock:
+            self._check_version(version)
+
+            entry = self._data.get(key)
+            if entry is not None:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+
+            if self.threshold < 1.0 and self._data:
+                query = self._unit(embedding)
+                same_filter = [k for k, e in self._data.items() if e[0] == filter_key]
+                if same_filter:
+                    matrix = np.stack([self._data[k][1] for k in same_filter])
+                    scores = matrix @ query
+                    best = int(np.argmax(scores))
+                    if scores[best] >= self.threshold:
+                        match = same_filter[best]
+                        self._data.move_to_end(match)
+                        self.hits += 1
+                        self.semantic_hits += 1
+                        return self._data[match][2]
+
+            self.misses += 1
+            return None
+
+    def put(
+        self,
+        question: str,
+        metadata_filter: Optional[Dict[str, Any]],
+        embedding,
+        value: Any,
+        version: str,
+    ) -> None:
+        filter_key = self._filter_key(metadata_filter)
+        key = (normalize_text(question), filter_key)
+        vector = self._unit(embedding)
+        nbytes = _approx_size(value) + vector.nbytes + _approx_size(key)
+        if nbytes > self.max_bytes:
+            return
+
+        with self._lock:
+            if self.version is not None and version != self.version:
+                # computed against an index that has since been replaced
+                return
+            self._check_version(version)
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[3]
+            self._data[key] = (filter_key, vector, value, nbytes)
+            self._bytes += nbytes
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self._bytes -= evicted[3]
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_entries": self.max_entries,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "threshold": self.threshold,
+            "version": self.version,
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
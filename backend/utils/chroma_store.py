@@ -0,0 +1,268 @@
+"""
+Process-wide handle on the Chroma store used by the API.
+
+The client, the collection and the embedding function are opened once and
+shared by every request. Ingest (utils/create_chroma.py) stamps the store with
+a new index version when it finishes, and the handle reopens itself the next
+time a request sees a different stamp.
+"""
+
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from utils.bm25 import load_bm25
+from utils.cache import CachedEmbeddingFunction, SemanticCache
+from utils.flat_index import load_flat_index
+from utils.shards import ShardRouter, load_shard_map
+
+CHROMA_PATH = os.getenv("CHROMA_PATH", "/app/chroma/.")
+COLLECTION_NAME = "jude-e-documents"
+INDEX_VERSION_FILE = "index_version"
+
+# "chroma" searches the collection; "flat" searches the memory-mapped
+# snapshot exported at ingest (falls back to chroma when there is none)
+RETRIEVER_BACKEND = os.getenv("RETRIEVER_BACKEND", "chroma").lower()
+
+QUERY_EMBED_CACHE_SIZE = int(os.getenv("QUERY_EMBED_CACHE_SIZE", "2048"))
+# seconds; unset means entries only leave the cache through LRU eviction
+QUERY_EMBED_CACHE_TTL = float(os.getenv("QUERY_EMBED_CACHE_TTL")) if os.getenv("QUERY_EMBED_CACHE_TTL") else None
+
+# cosine similarity above which two questions share a cached result
+RESULT_CACHE_THRESHOLD = float(os.getenv("RESULT_CACHE_THRESHOLD", "0.95"))
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "512"))
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+# seconds a replaced client stays up after a reopen, so requests still
+# holding the old collection handle can finish before its system stops
+RETIRED_CLIENT_GRACE = float(os.getenv("RETIRED_CLIENT_GRACE", "30"))
+
+
+def read_index_version(path: str = CHROMA_PATH) -> str:
+    """
+    Returns the ingest version stamp of the store at `path`.
+
+    Falls back to the mtime of the SQLite file for stores built before ingest
+    wrote a stamp, and to "" when there is no store at all.
+    """
+    root = Path(path)
+    try:
+        return (root / INDEX_VERSION_FILE).read_text().strip()
+    except FileNotFoundError:
+        pass
+    try:
+        return str((root / "chroma.sqlite3").stat().st_mtime_ns)
+    except FileNotFoundError:
+        return ""
+
+
+def new_index_version() -> str:
+    return f"{time.time_ns()}-{uuid.uuid4().hex[:8]}"
+
+
+def write_index_version(path: str = CHROMA_PATH, version: Optional[str] = None) -> str:
+    """
+    Stamps the store at `path` with an index version and returns it.
+
+    Pass `version` when other artifacts (e.g. shards) were already built for
+    it; otherwise a fresh one is generated.
+    """
+    version = version or new_index_version()
+    marker = Path(path) / INDEX_VERSION_FILE
+    tmp = marker.with_suffix(".tmp")
+    tmp.write_text(version)
+    # atomic swap so readers never see a half-written stamp
+    os.replace(tmp, marker)
+    return version
+
+
+class ChromaStore:
+    """
+    Shared client/collection/embedder (and the BM25 index built alongside
+    the collection) for the lifetime of the process.
+
+    Reads go through `collection` which is safe to call from concurrent
+    requests; reopening after a re-ingest happens under a lock so only one
+    request pays for it and the others keep using the old handle until the
+    new one is ready.
+    """
+
+    def __init__(
+        self,
+        path: str = CHROMA_PATH,
+        collection_name: str = COLLECTION_NAME,
+        version_check_interval: float = 5.0,
+        backend: str = RETRIEVER_BACKEND,
+    ):
+        self.path = path
+        self.collection_name = collection_name
+        self.version_check_interval = version_check_interval
+
+        # chromadb is imported here rather than at module load so importing
+        # the API stays cheap; the cost moves into the startup warmup
+        from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+
+        self.embedder = DefaultEmbeddingFunction()
+        # query embeddings only depend on the model, so this survives reopens
+        self.query_embedder = CachedEmbeddingFunction(
+            self.embedder,
+            max_size=QUERY_EMBED_CACHE_SIZE,
+            ttl=QUERY_EMBED_CACHE_TTL,
+        )
+        # retrieval results are tagged with the index version they came from
+        self.result_cache = SemanticCache(
+            threshold=RESULT_CACHE_THRESHOLD,
+            max_entries=RESULT_CACHE_MAX_ENTRIES,
+            max_bytes=RESULT_CACHE_MAX_BYTES,
+        )
+        self.backend = backend
+        self.client = None
+        self.bm25 = None
+        self.flat_index = None
+        self.router = None
+        self.version = ""
+
+        self._collection = None
+        self._lock = threading.Lock()
+        self._last_check = 0.0
+        # systems of replaced clients waiting out RETIRED_CLIENT_GRACE
+        self._retired: Dict[Any, threading.Timer] = {}
+
+    def open(self) -> None:
+        with self._lock:
+            self._open_locked()
+
+    def _open_locked(self) -> None:
+        import chromadb
+
+        version = read_index_version(self.path)
+        old_system = None
+        if self.client is not None:
+            # PersistentClient caches its system per path; drop it so the
+            # reopened client actually reloads the segments from disk.
+            # Dropping it from the cache does not stop it, so that is done
+            # below, once the new client is in place.
+            old_system = self.client._system
+            self.client.clear_system_cache()
+        self.client = chromadb.PersistentClient(path=self.path)
+        self._collection = self.client.get_collection(
+            name=self.collection_name,
+            embedding_function=self.embedder,
+        )
+        # lexical index written by the same ingest run; None for older stores
+        self.bm25 = load_bm25(self.path)
+        if self.bm25 is not None and self.bm25.metadatas is None:
+            # written before the filter fields were saved with it
+            found = self._collection.get(ids=self.bm25.ids, include=["metadatas"])
+            by_id = dict(zip(found["ids"], found["metadatas"]))
+            self.bm25.set_metadatas([by_id.get(doc_id) or {} for doc_id in self.bm25.ids])
+        self.flat_index = load_flat_index(self.path) if self.backend == "flat" else None
+        # only routes to shards built by the same ingest run as `version`
+        self.router = ShardRouter(self.client, load_shard_map(self.path), version)
+        if self.backend == "flat" and self.flat_index is None:
+            print("RETRIEVER_BACKEND=flat but no flat snapshot was exported, using Chroma")
+        self.version = version
+        self._last_check = time.monotonic()
+        if old_system is not None:
+            self._retire(old_system)
+        print(f"Opened Chroma collection '{self.collection_name}' (index version {version or 'unknown'})")
+
+    def _maybe_reopen(self) -> None:
+        now = time.monotonic()
+        if now - self._last_check < self.version_check_interval:
+            return
+        # only one request checks/reopens, the rest keep the current handle
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._last_check = now
+            if read_index_version(self.path) != self.version:
+                self._open_locked()
+        finally:
+            self._lock.release()
+
+    @property
+    def collection(self):
+        if self._collection is None:
+            with self._lock:
+                if self._collection is None:
+                    self._open_locked()
+        else:
+            self._maybe_reopen()
+        return self._collection
+
+    @property
+    def retriever(self):
+        """
+        The object get_context searches: the flat snapshot when that backend
+        is selected and available, otherwise the Chroma collection. Both
+        answer the same `query`/`get` calls.
+        """
+        collection = self.collection
+        return self.flat_index if self.flat_index is not None else collection
+
+    def route(self, where: Optional[Dict[str, Any]]) -> Tuple[Any, Optional[Dict[str, Any]]]:
+        """
+        Picks what to search for a metadata filter: the filter's own shard
+        (with the filter dropped, the shard holds exactly those chunks), or
+        the retriever with the filter applied.
+        """
+        retriever = self.retriever
+        if where is None or retriever is self.flat_index:
+            return retriever, where
+        shard = self.router.route(where)
+        if shard is None:
+            return retriever, where
+        return shard, None
+
+    def _retire(self, system) -> None:
+        """
+        Stops a replaced client's system (its SQLite connections and HNSW
+        segments) after the grace period.
+        """
+        def stop():
+            if self._retired.pop(system, None) is not None:
+                _stop_system(system)
+
+        timer = threading.Timer(RETIRED_CLIENT_GRACE, stop)
+        timer.daemon = True
+        self._retired[system] = timer
+        timer.start()
+
+    def close(self) -> None:
+        with self._lock:
+            for system, timer in list(self._retired.items()):
+                timer.cancel()
+                if self._retired.pop(system, None) is not None:
+                    _stop_system(system)
+            if self.client is not None:
+                system = self.client._system
+                self.client.clear_system_cache()
+                _stop_system(system)
+            self.client = None
+            self._collection = None
+            self.flat_index = None
+            self.router = None
+
+
+def _stop_system(system) -> None:
+    try:
+        system.stop()
+    except Exception as e:
+        print(f"Error stopping Chroma client: {e}")
+
+
+_store: Optional[ChromaStore] = None
+
+
+def get_store() -> ChromaStore:
+    """
+    Returns the process-wide store, creating it on first use.
+    """
+    global _store
+    if _store is None:
+        _store = ChromaStore()
+    return _store
@@ -1,38 +1,400 @@
-import chromadb
+"""
+Builds the jude-e-documents collection from the CSVs in scrapped_data/.
 
-# go through all files in scrapped_data folder and add to collection
-import os
-from langchain.text_splitter import CharacterTextSplitter
-from langchain.document_loaders import TextLoader
+Rows are streamed from the CSVs, chunked and embedded in a pool of worker
+processes, and written in fixed-size batches through one shared Chroma
+client. Chunk ids are content hashes and a manifest next to the store
+records what is indexed, so a re-run only embeds new or changed chunks,
+rewrites the metadata of chunks whose text is unchanged but whose metadata
+moved (every scrape stamps a new retrieved_at), and deletes the ones that
+disappeared. Run from the backend directory:
+
+	python utils/create_chroma.py [--workers N] [--batch-size N] [--full] [--shards | --no-shards]
+
+Shards are opt-in with --shards and then sticky: every later run rebuilds
+them for the version it stamps, so routing never silently stops. Pass
+--no-shards to remove them.
+"""
+
+import argparse
+import ast
 import csv
+import datetime
+import hashlib
+import json
+import os
+import sys
+import time
+from collections import deque
+from multiprocessing import get_context
+
+import chromadb
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.bm25 import BM25_FILE, BM25Index
+from utils.chroma_store import CHROMA_PATH, COLLECTION_NAME, new_index_version, write_index_version
+from utils.flat_index import export_snapshot
+from utils.metadata_filter import all_metadata_filters
+from utils.shards import build_shards, drop_shards, load_shard_map
+
+# rows handed to a worker per task
+ROWS_PER_TASK = 32
+
+MANIFEST_FILE = "ingest_manifest.json"
+# bump when chunk ids or stored fields change shape, to force a full rebuild
+MANIFEST_FORMAT = 3
+
+# fields of the scraped metadata column stored as first-class chunk metadata
+METADATA_FIELDS = ("source_url", "title", "section", "super_section", "retrieved_at")
+# the ones that identify a chunk; retrieved_at changes on every scrape
+ID_FIELDS = ("source_url", "title", "section", "super_section")
+
+# set up once per worker process by _init_worker
+_splitter = None
+_embedder = None
+_embed_batch_size = None
+_known = {}
+
+
+def _init_worker(chunk_size, chunk_overlap, embed_batch_size, known, embedding_function=None):
+	global _splitter, _embedder, _embed_batch_size, _known
+	from langchain.text_splitter import CharacterTextSplitter
+
+	if embedding_function is None:
+		from chromadb.utils.embedding_functions import DefaultEmbeddingFunction as embedding_function
+
+	_splitter = CharacterTextSplitter(separator="\n", chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+	_embedder = embedding_function()
+	_embed_batch_size = embed_batch_size
+	_known = known
+
+
+def chunk_id(filename, text, metadata):
+	"""
+	Content-derived chunk id: stable across row shifts and re-scrapes, new
+	when the text or the page it belongs to changes. Volatile metadata
+	(retrieved_at) is left out and tracked by metadata_hash instead.
+	"""
+	parts = [filename] + [metadata.get(field, "") for field in ID_FIELDS] + [text]
+	digest = hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+	return digest[:32]
+
+
+def metadata_hash(metadata):
+	return hashlib.sha256(json.dumps(metadata, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def parse_metadata(filename, raw):
+	"""
+	Turns the scraped metadata column (a Python dict repr) into flat, typed
+	Chroma metadata. Missing or None fields are left out, since Chroma
+	metadata values cannot be null; retrieved_at also gets an epoch-seconds
+	twin so it can be range-filtered.
+
+	Chroma indexes metadata by (key, string_value) in SQLite, so a
+	where={"section": ...} filter resolves to the matching chunk ids before
+	the vector search runs over just that subset.
+	"""
+	metadata = {"source": filename}
+	try:
+		parsed = ast.literal_eval(raw) if raw else {}
+	except (ValueError, SyntaxError):
+		parsed = {}
+	if not isinstance(parsed, dict):
+		parsed = {}
+
+	for field in METADATA_FIELDS:
+		value = parsed.get(field)
+		if value is None:
+			continue
+		metadata[field] = str(value)
+
+	if "retrieved_at" in metadata:
+		try:
+			metadata["retrieved_at_ts"] = datetime.datetime.fromisoformat(metadata["retrieved_at"]).timestamp()
+		except ValueError:
+			pass
+	return metadata
+
+
+def process_rows(rows):
+	"""
+	Worker task: chunks a list of (filename, row_index, text, metadata) rows
+	and embeds the chunks not already indexed, in fixed-size batches.
+
+	Returns (n_rows, seen, ids, documents, metadatas, embeddings, updates)
+	where seen holds (id, metadata_hash) for every distinct chunk in row
+	order, updates holds (id, metadata) for indexed chunks whose metadata
+	alone changed, and the rest describe only new chunks. A chunk that
+	occurs more than once (the scrapes repeat pages, differing only in
+	retrieved_at) is described by its first occurrence.
+	"""
+	seen = {}
+	ids, docs, metadatas = [], [], []
+	updates = []
+	for filename, i, text, raw_metadata in rows:
+		metadata = parse_metadata(filename, raw_metadata)
+		meta_hash = metadata_hash(metadata)
+		for split in _splitter.split_text(text):
+			doc_id = chunk_id(filename, split, metadata)
+			if doc_id in seen:
+				continue
+			seen[doc_id] = meta_hash
+			if doc_id in _known:
+				if _known[doc_id] != meta_hash:
+					updates.append((doc_id, metadata))
+				continue
+			ids.append(doc_id)
+			docs.append(split)
+			metadatas.append(metadata)
+
+	embeddings = []
+	for start in range(0, len(docs), _embed_batch_size):
+		embeddings.extend(_embedder(docs[start:start + _embed_batch_size]))
+	return len(rows), list(seen.items()), ids, docs, metadatas, embeddings, updates
+
 
-for filename in os.listdir("scrapped_data"):
-	chroma_client = chromadb.PersistentClient(path="/app/chroma/.")
-	# remove old collection if it exists
-	# if chroma_client.get_collection(name="jude-e-documents"):
-	# chroma_client.delete_collection(name="jude-e-documents")
-	collection = chroma_client.get_or_create_collection(name="jude-e-documents")
-	if filename.endswith(".csv"):
-		filepath = os.path.join("scrapped_data", filename)
+def iter_rows(data_dir):
+	"""
+	Streams (filename, row_index, text, metadata) from every CSV in data_dir.
+	"""
+	for filename in sorted(os.listdir(data_dir)):
+		if not filename.endswith(".csv"):
+			continue
+		filepath = os.path.join(data_dir, filename)
 		with open(filepath, newline='', encoding='utf-8') as csvfile:
-			reader = csv.reader(csvfile)
-			all_docs = []
-			all_metadatas = []
-			all_ids = []
-			for i, row in enumerate(reader):
+			for i, row in enumerate(csv.reader(csvfile)):
 				if len(row) < 3:
 					continue  # skip malformed rows
-				text = row[1]
-				metadata = row[2]
-				text_splitter = CharacterTextSplitter(separator="\n", chunk_size=1000, chunk_overlap=200)
-				# Split the text from the 2nd column
-				splits = text_splitter.split_text(text)
-				for j, split in enumerate(splits):
-					all_docs.append(split)
-					all_metadatas.append({"source": filename, "metadata": metadata})
-					all_ids.append(f"{filename}-{i}-{j}")
-			if all_docs:
-				collection.add(documents=all_docs, metadatas=all_metadatas, ids=all_ids)
-
-# print number of documents in collection
-print(f"Number of documents in collection: {collection.count()}")
\ No newline at end of file
+				yield filename, i, row[1], row[2]
+
+
+def iter_tasks(rows):
+	"""
+	Groups rows into worker tasks of ROWS_PER_TASK rows.
+	"""
+	task = []
+	for row in rows:
+		task.append(row)
+		if len(task) == ROWS_PER_TASK:
+			yield task
+			task = []
+	if task:
+		yield task
+
+
+def load_manifest(chroma_path):
+	try:
+		with open(os.path.join(chroma_path, MANIFEST_FILE), encoding="utf-8") as fh:
+			return json.load(fh)
+	except FileNotFoundError:
+		return None
+
+
+def save_manifest(chroma_path, settings, ids):
+	manifest = {"format": MANIFEST_FORMAT, "settings": settings, "ids": ids}
+	path = os.path.join(chroma_path, MANIFEST_FILE)
+	with open(path + ".tmp", "w", encoding="utf-8") as fh:
+		json.dump(manifest, fh)
+	os.replace(path + ".tmp", path)
+
+
+def ingest(
+	data_dir,
+	chroma_path,
+	workers,
+	batch_size,
+	chunk_size,
+	chunk_overlap,
+	full=False,
+	embedding_function=None,
+):
+	"""
+	Brings the collection in line with data_dir and returns (client, collection, changed).
+
+	embedding_function is a picklable zero-argument factory for the workers'
+	embedder (DefaultEmbeddingFunction when None). A failure in a worker or
+	in a write is raised here.
+	"""
+	settings = {"chunk_size": chunk_size, "chunk_overlap": chunk_overlap}
+	chroma_client = chromadb.PersistentClient(path=chroma_path)
+
+	manifest = load_manifest(chroma_path)
+	if manifest and (manifest.get("format") != MANIFEST_FORMAT or manifest.get("settings") != settings):
+		print("Chunking settings or id format changed since the last ingest, rebuilding")
+		full = True
+	if full:
+		try:
+			chroma_client.delete_collection(name=COLLECTION_NAME)
+		except Exception:
+			pass  # nothing to delete yet
+	collection = chroma_client.get_or_create_collection(name=COLLECTION_NAME)
+
+	# id -> metadata_hash of everything indexed; the manifest is the fast
+	# path, trust the collection itself if they disagree
+	if manifest and not full and len(manifest["ids"]) == collection.count():
+		indexed = manifest["ids"]
+	else:
+		existing = collection.get(include=["metadatas"])
+		indexed = {doc_id: metadata_hash(m or {}) for doc_id, m in zip(existing["ids"], existing["metadatas"])}
+	print(f"{len(indexed)} chunks already indexed")
+
+	seen = {}
+	pending = {"ids": [], "documents": [], "metadatas": [], "embeddings": []}
+	updates = {"ids": [], "metadatas": []}
+	n_rows = n_chunks = n_updated = 0
+	start = time.time()
+
+	def flush():
+		nonlocal n_chunks
+		while pending["ids"]:
+			batch = {key: values[:batch_size] for key, values in pending.items()}
+			collection.upsert(**batch)
+			for values in pending.values():
+				del values[:batch_size]
+			n_chunks += len(batch["ids"])
+
+	def flush_updates():
+		# metadata-only changes (e.g. a new retrieved_at): no re-embedding
+		nonlocal n_updated
+		while updates["ids"]:
+			batch = {key: values[:batch_size] for key, values in updates.items()}
+			collection.update(**batch)
+			for values in updates.values():
+				del values[:batch_size]
+			n_updated += len(batch["ids"])
+
+	def consume(result):
+		nonlocal n_rows
+		rows, task_seen, ids, docs, metadatas, embeddings, task_updates = result
+		new = {doc_id: (doc, metadata, embedding) for doc_id, doc, metadata, embedding in zip(ids, docs, metadatas, embeddings)}
+		changed_metadata = dict(task_updates)
+		# results arrive in row order, so the first task to describe a
+		# chunk decides its metadata, on every run alike
+		for doc_id, meta_hash in task_seen:
+			if doc_id in seen:
+				continue  # identical chunk earlier in this run
+			seen[doc_id] = meta_hash
+			if doc_id in new:
+				doc, metadata, embedding = new[doc_id]
+				pending["ids"].append(doc_id)
+				pending["documents"].append(doc)
+				pending["metadatas"].append(metadata)
+				pending["embeddings"].append(embedding)
+			elif doc_id in changed_metadata:
+				updates["ids"].append(doc_id)
+				updates["metadatas"].append(changed_metadata[doc_id])
+		n_rows += rows
+		if len(pending["ids"]) >= batch_size:
+			flush()
+			elapsed = time.time() - start
+			print(f"{n_rows} rows, {n_chunks} chunks written ({n_rows / elapsed:.1f} rows/s)")
+		if len(updates["ids"]) >= batch_size:
+			flush_updates()
+
+	# spawned (not forked) workers never share the client's SQLite handles
+	initargs = (chunk_size, chunk_overlap, batch_size, indexed, embedding_function)
+	with get_context("spawn").Pool(workers, initializer=_init_worker, initargs=initargs) as pool:
+		# Tasks are submitted from this thread and at most workers * 2 are
+		# in flight, so the pool never reads far ahead of what has been
+		# stored. Results are taken in submission order; .get() re-raises a
+		# worker's exception and the pool is terminated on the way out.
+		in_flight = deque()
+		for task in iter_tasks(iter_rows(data_dir)):
+			in_flight.append(pool.apply_async(process_rows, (task,)))
+			if len(in_flight) >= workers * 2:
+				consume(in_flight.popleft().get())
+		while in_flight:
+			consume(in_flight.popleft().get())
+		flush()
+		flush_updates()
+
+	# chunks whose rows were edited or removed since the last run
+	stale = sorted(indexed.keys() - seen.keys())
+	for i in range(0, len(stale), batch_size):
+		collection.delete(ids=stale[i:i + batch_size])
+
+	save_manifest(chroma_path, settings, seen)
+
+	elapsed = time.time() - start
+	print(
+		f"Scanned {n_rows} rows in {elapsed:.1f}s ({n_rows / max(elapsed, 1e-9):.1f} rows/s): "
+		f"{n_chunks} chunks embedded, {n_updated} metadata updates, "
+		f"{len(seen) - n_chunks - n_updated} unchanged, {len(stale)} deleted"
+	)
+	return chroma_client, collection, bool(n_chunks or n_updated or stale or full)
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--data-dir", default="scrapped_data")
+	parser.add_argument("--chroma-path", default=CHROMA_PATH)
+	parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+	parser.add_argument("--batch-size", type=int, default=256, help="chunks per embedding call and per collection write")
+	parser.add_argument("--chunk-size", type=int, default=1000)
+	parser.add_argument("--chunk-overlap", type=int, default=200)
+	parser.add_argument("--full", action="store_true", help="drop the collection and re-embed everything")
+	shards = parser.add_mutually_exclusive_group()
+	shards.add_argument("--shards", action="store_true", help="also write per-section shard collections (kept up on later runs)")
+	shards.add_argument("--no-shards", action="store_true", help="remove the shard collections and stop building them")
+	parser.add_argument("--shard-min-chunks", type=int, default=20, help="shard any section with at least this many chunks")
+	args = parser.parse_args()
+
+	client, collection, changed = ingest(
+		args.data_dir,
+		args.chroma_path,
+		workers=args.workers,
+		batch_size=args.batch_size,
+		chunk_size=args.chunk_size,
+		chunk_overlap=args.chunk_overlap,
+		full=args.full,
+	)
+
+	# print number of documents in collection
+	print(f"Number of documents in collection: {collection.count()}")
+
+	# a store that has shards keeps them up to date; a new version without
+	# them would stop the API routing to the old ones anyway
+	had_shards = load_shard_map(args.chroma_path) is not None
+	build = args.shards or (had_shards and not args.no_shards)
+	if not build:
+		dropped = drop_shards(client, args.chroma_path)
+		if dropped:
+			print(f"Shards: deleted {dropped} collections no longer in use")
+
+	# dropping the map needs a new version too, or the API keeps routing to
+	# the collections the next run deletes
+	if not changed and not args.shards and not (had_shards and args.no_shards):
+		print("Nothing changed, keeping the current index version")
+		return
+
+	# build the BM25 lexical index over everything in the collection
+	everything = collection.get(include=["documents", "metadatas"])
+	bm25 = BM25Index.build(everything["ids"], everything["documents"], everything["metadatas"])
+	bm25.save(os.path.join(args.chroma_path, BM25_FILE))
+	print(f"BM25 index: {bm25.n_docs} documents, {bm25.n_terms} terms")
+
+	# normalized float32 matrix + sidecar for RETRIEVER_BACKEND=flat
+	print(f"Flat snapshot: {export_snapshot(collection, args.chroma_path)} rows")
+
+	# shards are built for the version we are about to stamp, so the API
+	# only routes to them once it has reopened the matching store
+	version = new_index_version()
+	if build:
+		shard_map = build_shards(
+			client,
+			collection,
+			version,
+			args.chroma_path,
+			filters=all_metadata_filters(),
+			min_chunks=args.shard_min_chunks,
+			batch_size=args.batch_size,
+		)
+		print(f"Shards: {len(shard_map['shards'])} collections")
+
+	# let the running API know it has to reopen the store
+	print(f"Index version: {write_index_version(args.chroma_path, version)}")
+
+
+if __name__ == "__main__":
+	main()
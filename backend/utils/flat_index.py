@@ -0,0 +1,325 @@
+"""
+Exact brute-force retriever over a memory-mapped embedding snapshot.
+
+At a few thousand chunks one dot product over a contiguous float32 matrix
+is faster and more predictable than Chroma's SQLite + HNSW path. Ingest
+exports the snapshot next to the Chroma store:
+
+    flat_index.npy              L2-normalized embeddings, one row per chunk
+    flat_index.float16.npy      the same matrix in float16
+    flat_index.int8.npy         int8 rows, scaled per vector ...
+    flat_index.int8_scale.npy   ... by these float32 factors
+    flat_index.json             ids, documents and metadata in row order
+
+The matrices are opened with np.load(mmap_mode="r"), so every uvicorn
+worker maps the same files and shares their pages through the OS page
+cache. With a quantized precision the coarse search scans only the
+float16/int8 matrix and the top candidates are rescored against the
+float32 rows, so only those few pages of the full-precision file are read.
+`FlatIndex` mimics the parts of the Chroma collection API that
+get_context uses (`query` and `get`), so it can stand in for it.
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+
+MATRIX_FILE = "flat_index.npy"
+FLOAT16_FILE = "flat_index.float16.npy"
+INT8_FILE = "flat_index.int8.npy"
+INT8_SCALE_FILE = "flat_index.int8_scale.npy"
+SIDECAR_FILE = "flat_index.json"
+
+PRECISIONS = ("float32", "float16", "int8")
+# matrix the coarse search scans: float32, float16 or int8. The quantized
+# ones halve/quarter the memory but are slower: each block is converted to
+# float32 before the product, and that conversion (float16 especially)
+# costs more than scanning float32 directly. On 6000x384 synthetic vectors
+# (benchmarks/bench_quantization.py) float16 ran ~8-12x and int8 ~2.5x
+# the float32 latency, all at recall@10 1.0. Pick them for memory only.
+FLAT_INDEX_PRECISION = os.getenv("FLAT_INDEX_PRECISION", "float32").lower()
+# coarse candidates kept per result for the full-precision rescoring pass
+FLAT_RESCORE_FACTOR = int(os.getenv("FLAT_RESCORE_FACTOR", "4"))
+
+# rows converted to float32 at a time while scanning a quantized matrix
+_BLOCK_ROWS = 2048
+
+# metadata fields that get a precomputed row index for filtering
+MASKED_FIELDS = ("section", "super_section", "title", "source")
+
+
+class RowMasks:
+    """
+    (field, value) -> sorted row indices for the MASKED_FIELDS, built once
+    per snapshot so a metadata filter becomes an index lookup.
+    """
+
+    def __init__(self, metadatas: List[Dict[str, Any]]):
+        rows: Dict[tuple, List[int]] = {}
+        for i, metadata in enumerate(metadatas):
+            for field in MASKED_FIELDS:
+                value = (metadata or {}).get(field)
+                if value is not None:
+                    rows.setdefault((field, value), []).append(i)
+        self._rows = {key: np.asarray(value, dtype=np.int64) for key, value in rows.items()}
+
+    def rows_for(self, where: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """
+        Row indices matching a metadata filter, or None for "all rows".
+
+        Supports the {"field": {"$eq": v}} and {"field": {"$in": [...]}}
+        shapes that detect_metadata_filter produces.
+        """
+        if not where:
+            return None
+        if len(where) != 1:
+            raise ValueError(f"Only single-field filters are supported, got {where}")
+        (field, condition), = where.items()
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        if "$eq" in condition:
+            values = [condition["$eq"]]
+        elif "$in" in condition:
+            values = condition["$in"]
+        else:
+            raise ValueError(f"Unsupported filter operator in {where}")
+
+        empty = np.zeros(0, dtype=np.int64)
+        parts = [self._rows.get((field, v), empty) for v in values]
+        return parts[0] if len(parts) == 1 else np.unique(np.concatenate(parts))
+
+
+def quantize_int8(matrix: np.ndarray):
+    """
+    Per-vector symmetric int8 quantization: row ~= q[row] * scale[row].
+    """
+    scale = np.abs(matrix).max(axis=1) / 127.0 if len(matrix) else np.zeros(0, dtype=np.float32)
+    scale = scale.astype(np.float32)
+    safe = np.where(scale == 0, 1.0, scale)[:, None]
+    quantized = np.clip(np.rint(matrix / safe), -127, 127).astype(np.int8)
+    return quantized, scale
+
+
+def _save_npy(path: Path, array: np.ndarray) -> Path:
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as fh:
+        np.save(fh, np.ascontiguousarray(array))
+    return tmp
+
+
+def export_snapshot(collection, path: Union[str, Path], batch_size: int = 1024) -> int:
+    """
+    Writes the flat snapshot of `collection` into directory `path`.
+
+    Returns the number of rows written. Files are swapped in atomically so
+    processes that still map the previous snapshot keep a valid file.
+    """
+    path = Path(path)
+    total = collection.count()
+    ids: List[str] = []
+    documents: List[str] = []
+    metadatas: List[Dict[str, Any]] = []
+    chunks = []
+    for offset in range(0, total, batch_size):
+        batch = collection.get(
+            limit=batch_size,
+            offset=offset,
+            include=["documents", "metadatas", "embeddings"],
+        )
+        ids.extend(batch["ids"])
+        documents.extend(batch["documents"])
+        metadatas.extend(m or {} for m in batch["metadatas"])
+        chunks.append(np.asarray(batch["embeddings"], dtype=np.float32))
+
+    matrix = np.concatenate(chunks) if chunks else np.zeros((0, 0), dtype=np.float32)
+    if len(matrix):
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        matrix /= norms
+
+    quantized, scale = quantize_int8(matrix)
+    written = {
+        MATRIX_FILE: _save_npy(path / MATRIX_FILE, matrix),
+        FLOAT16_FILE: _save_npy(path / FLOAT16_FILE, matrix.astype(np.float16)),
+        INT8_FILE: _save_npy(path / INT8_FILE, quantized),
+        INT8_SCALE_FILE: _save_npy(path / INT8_SCALE_FILE, scale),
+    }
+    tmp_sidecar = path / (SIDECAR_FILE + ".tmp")
+    with open(tmp_sidecar, "w", encoding="utf-8") as fh:
+        json.dump({"ids": ids, "documents": documents, "metadatas": metadatas}, fh, ensure_ascii=False)
+    written[SIDECAR_FILE] = tmp_sidecar
+
+    for name, tmp in written.items():
+        os.replace(tmp, path / name)
+    return len(ids)
+
+
+class FlatIndex:
+    """
+    Top-k by one matrix product and `argpartition` over a memory-mapped matrix.
+
+    With `precision` float16 or int8 the product runs over the quantized
+    matrix and the best `rescore_factor * k` rows are rescored exactly
+    against the float32 `matrix`.
+    """
+
+    def __init__(
+        self,
+        matrix: np.ndarray,
+        ids: List[str],
+        documents: List[str],
+        metadatas: List[Dict[str, Any]],
+        coarse: Optional[np.ndarray] = None,
+        scales: Optional[np.ndarray] = None,
+        precision: str = "float32",
+        rescore_factor: int = FLAT_RESCORE_FACTOR,
+    ):
+        self.matrix = matrix
+        self.coarse = coarse
+        self.scales = scales
+        self.precision = precision if coarse is not None else "float32"
+        self.rescore_factor = rescore_factor
+        self.ids = ids
+        self.documents = documents
+        self.metadatas = metadatas
+        self.positions = {doc_id: i for i, doc_id in enumerate(ids)}
+        self._masks = RowMasks(metadatas)
+
+    @classmethod
+    def load(cls, path: Union[str, Path], precision: str = FLAT_INDEX_PRECISION) -> "FlatIndex":
+        if precision not in PRECISIONS:
+            raise ValueError(f"precision must be one of {PRECISIONS}, got {precision!r}")
+        path = Path(path)
+        matrix = np.load(path / MATRIX_FILE, mmap_mode="r")
+        coarse = scales = None
+        if precision == "float16":
+            coarse = np.load(path / FLOAT16_FILE, mmap_mode="r")
+        elif precision == "int8":
+            coarse = np.load(path / INT8_FILE, mmap_mode="r")
+            scales = np.load(path / INT8_SCALE_FILE)
+        with open(path / SIDECAR_FILE, encoding="utf-8") as fh:
+            sidecar = json.load(fh)
+        return cls(
+            matrix, sidecar["ids"], sidecar["documents"], sidecar["metadatas"],
+            coarse=coarse, scales=scales, precision=precision,
+        )
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    def rows_for(self, where: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        return self._masks.rows_for(where)
+
+    def _fields(self, rows, include: List[str]) -> Dict[str, List[Any]]:
+        out: Dict[str, List[Any]] = {"ids": [self.ids[i] for i in rows]}
+        if "documents" in include:
+            out["documents"] = [self.documents[i] for i in rows]
+        if "metadatas" in include:
+            out["metadatas"] = [self.metadatas[i] for i in rows]
+        if "embeddings" in include:
+            out["embeddings"] = [self.matrix[i] for i in rows]
+        return out
+
+    def query(
+        self,
+        query_embeddings: List[Any],
+        n_results: int = 10,
+        where: Optional[Dict[str, Any]] = None,
+        include: Optional[List[str]] = None,
+        **kwargs,
+    ) -> Dict[str, Any]:
+        """
+        Chroma-shaped query results; distances are cosine distances (1 - cos).
+        """
+        if "query_texts" in kwargs:
+            raise ValueError("FlatIndex needs query_embeddings; embed the queries first")
+        include = include or ["documents", "distances"]
+
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        queries = queries / norms
+
+        rows = self.rows_for(where)
+        n_rows = len(self.ids) if rows is None else len(rows)
+        k = min(n_results, n_rows)
+
+        results: Dict[str, List[Any]] = {name: [] for name in ["ids", *include]}
+        if self.precision == "float32":
+            matrix = self.matrix if rows is None else self.matrix[rows]
+            scores = queries @ matrix.T  # (n_queries, n_rows)
+            picks = [self._top(q_scores, k) for q_scores in scores]
+            picks = [(top if rows is None else rows[top], q_scores[top]) for top, q_scores in zip(picks, scores)]
+        else:
+            coarse_scores = self._coarse_scores(queries, rows)
+            n_coarse = min(n_rows, max(k, k * self.rescore_factor))
+            picks = []
+            for query, q_scores in zip(queries, coarse_scores):
+                candidates = self._top(q_scores, n_coarse)
+                candidates = candidates if rows is None else rows[candidates]
+                # exact rescoring only touches the candidates' float32 rows
+                candidates = np.sort(candidates)
+                exact = np.asarray(self.matrix[candidates]) @ query
+                best = self._top(exact, k)
+                picks.append((candidates[best], exact[best]))
+
+        for picked, picked_scores in picks:
+            for name, values in self._fields(picked, include).items():
+                results[name].append(values)
+            if "distances" in include:
+                results["distances"].append((1.0 - picked_scores).tolist())
+        return results
+
+    @staticmethod
+    def _top(scores: np.ndarray, k: int) -> np.ndarray:
+        if k <= 0:
+            return np.zeros(0, dtype=np.int64)
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top])]
+
+    def _coarse_scores(self, queries: np.ndarray, rows: Optional[np.ndarray]) -> np.ndarray:
+        """
+        Approximate scores over the quantized matrix, converted block by block
+        so the float32 working set stays bounded.
+        """
+        n_rows = len(self.ids) if rows is None else len(rows)
+        scores = np.empty((len(queries), n_rows), dtype=np.float32)
+        for start in range(0, n_rows, _BLOCK_ROWS):
+            stop = min(start + _BLOCK_ROWS, n_rows)
+            index = slice(start, stop) if rows is None else rows[start:stop]
+            block = np.asarray(self.coarse[index], dtype=np.float32)
+            block_scores = queries @ block.T
+            if self.scales is not None:
+                block_scores *= self.scales[index]
+            scores[:, start:stop] = block_scores
+        return scores
+
+    def get(
+        self,
+        ids: Optional[List[str]] = None,
+        where: Optional[Dict[str, Any]] = None,
+        include: Optional[List[str]] = None,
+    ) -> Dict[str, List[Any]]:
+        include = include or ["documents", "metadatas"]
+        if ids is None:
+            picked = np.arange(len(self.ids))
+        else:
+            picked = np.asarray([self.positions[i] for i in ids if i in self.positions], dtype=np.int64)
+        allowed = self.rows_for(where)
+        if allowed is not None:
+            picked = picked[np.isin(picked, allowed)]
+        return self._fields(picked, include)
+
+
+def load_flat_index(path: Union[str, Path], precision: str = FLAT_INDEX_PRECISION) -> Optional[FlatIndex]:
+    """
+    Loads the snapshot exported next to the Chroma store, or None if there is none.
+    """
+    path = Path(path)
+    needed = {"float32": [], "float16": [FLOAT16_FILE], "int8": [INT8_FILE, INT8_SCALE_FILE]}.get(precision, [])
+    if not all((path / name).is_file() for name in [MATRIX_FILE, SIDECAR_FILE, *needed]):
+        return None
+    return FlatIndex.load(path, precision=precision)
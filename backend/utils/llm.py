@@ -0,0 +1,88 @@
+"""
+Streaming Ollama client for the /chat endpoint.
+
+One httpx.AsyncClient is shared by every request, so generations reuse
+warm keep-alive connections to Ollama instead of opening a new one per
+question. The prompt and system prompt are the ones the Node chat
+service (judee-web/server.js) used, so answers read the same.
+"""
+
+import json
+import os
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "qwen3:1.7b")
+OLLAMA_MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "8"))
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5"))
+# generous: the first token can take a while when Ollama loads the model
+OLLAMA_READ_TIMEOUT = float(os.getenv("OLLAMA_READ_TIMEOUT", "120"))
+
+SYSTEM_PROMPT = (
+    'You are Jude-E, a helpful assistant for families, child patients, and caregivers at St. Jude Children’s Research Hospital. You provide clear, supportive information about childhood diseases, cancer, hospital directions, food, and services.'
+    '{kid}'
+    'Guidelines: Base answers on retrieved St. Jude or disease info documents. Use simple, compassionate language. Avoid medical jargon unless in the source. Do not give personal medical advice, diagnoses, or treatment. Instead, encourage families to consult their doctor. Answer in English only, max 300 words. Structure: short paragraphs or bullet points. Mention source naturally (e.g., “According to St. Jude’s page on brain tumors…”).'
+    'Tone: Supportive, empathetic. If speaking to a child, make it extra clear, gentle, and encouraging. If no relevant info is found, say so and offer related resources instead.'
+    'Role: You inform, not advise. Your goal is to make families feel supported and guided to trusted sources. '
+)
+KID_PROMPT = (
+    ' IMPORTANT INFORMATION: You are responding to a CHILD, ensure your language is age-appropriate, clear, and comforting. The child might be a patient, express empathy and understanding. The user role is always "Child"'
+)
+
+GENERATION_OPTIONS = {"temperature": 0.1, "top_p": 0.75, "top_k": 40}
+
+
+def system_prompt(user_role: Optional[str]) -> str:
+    return SYSTEM_PROMPT.format(kid=KID_PROMPT if user_role == "kid" else "")
+
+
+def build_prompt(question: str, documents: List[str]) -> str:
+    context = "\n\n---\n\n".join(documents)
+    return f"Context: {context}\n\nQuestion: {question}\nAnswer:"
+
+
+class OllamaClient:
+    """
+    Pooled async client for Ollama's /api/generate.
+    """
+
+    def __init__(self, base_url: str = OLLAMA_URL, model: str = OLLAMA_MODEL):
+        self.model = model
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=httpx.Timeout(OLLAMA_READ_TIMEOUT, connect=OLLAMA_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=OLLAMA_MAX_CONNECTIONS,
+                max_keepalive_connections=OLLAMA_MAX_CONNECTIONS,
+            ),
+        )
+
+    async def generate_stream(self, prompt: str, system: str) -> AsyncIterator[bytes]:
+        """
+        Yields Ollama's NDJSON lines ({"response": ..., "done": ...}) as they arrive.
+        """
+        payload: Dict[str, Any] = {
+            "model": self.model,
+            "system": system,
+            "prompt": prompt,
+            "think": False,
+            "stream": True,
+            "options": GENERATION_OPTIONS,
+        }
+        async with self._client.stream("POST", "/api/generate", json=payload) as response:
+            if response.status_code != 200:
+                body = await response.aread()
+                raise RuntimeError(f"Ollama returned {response.status_code}: {body[:200]!r}")
+            async for line in response.aiter_lines():
+                if line.strip():
+                    yield (line + "\n").encode("utf-8")
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+
+def error_line(message: str) -> bytes:
+    # same shape ChatBox reads, so the failure shows up in the chat
+    return (json.dumps({"response": message, "error": True, "done": True}) + "\n").encode("utf-8")
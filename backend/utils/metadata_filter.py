@@ -0,0 +1,111 @@
+"""
+Maps trigger phrases in a question to a Chroma metadata filter.
+
+Triggers and pair rules live in data/section_triggers.json so new sections
+can be added without code edits. Everything is compiled once at import;
+a lookup is a single regex pass over the lowercased question.
+"""
+
+import json
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+TRIGGERS_PATH = Path(__file__).resolve().parent.parent / "data" / "section_triggers.json"
+
+
+class TriggerMatcher:
+    """
+    Finds the highest-priority trigger phrase in a question in one pass.
+
+    Priority is the order of the triggers in the data file, matching the
+    old first-match-wins scan over the `mapping` dict. Matching is plain
+    substring matching on the lowercased question, as before.
+    """
+
+    def __init__(self, triggers: List[Dict[str, Any]], pair_rules: List[Dict[str, Any]]):
+        self.phrases: List[str] = [t["phrase"].lower() for t in triggers]
+        self.filters: List[Dict[str, Any]] = [t["filter"] for t in triggers]
+        self._priority: Dict[str, int] = {}
+        for i, phrase in enumerate(self.phrases):
+            self._priority.setdefault(phrase, i)
+
+        # Zero-width lookahead so overlapping triggers are all seen; at a
+        # given position the alternation tries phrases in priority order.
+        if self.phrases:
+            alternation = "|".join(re.escape(p) for p in self.phrases)
+            self._pattern: Optional[re.Pattern] = re.compile(f"(?=({alternation}))")
+        else:
+            self._pattern = None
+
+        self.pair_rules: List[Tuple[re.Pattern, List[str]]] = [
+            (self._compile_pair_rule(rule["first"], rule["second"]), rule["sections"])
+            for rule in pair_rules
+        ]
+
+    @staticmethod
+    def _compile_pair_rule(first: List[str], second: List[str]) -> re.Pattern:
+        a = "|".join(re.escape(w) for w in first)
+        b = "|".join(re.escape(w) for w in second)
+        return re.compile(
+            rf"\b(?:{a})\b.*\b(?:{b})\b|\b(?:{b})\b.*\b(?:{a})\b",
+            re.I,
+        )
+
+    @classmethod
+    def from_file(cls, path: Path = TRIGGERS_PATH) -> "TriggerMatcher":
+        with open(path, encoding="utf-8") as fh:
+            data = json.load(fh)
+        return cls(data.get("triggers", []), data.get("pair_rules", []))
+
+    def all_filters(self) -> List[Dict[str, Any]]:
+        """
+        Every distinct filter `match` can return, in priority order.
+        """
+        filters: List[Dict[str, Any]] = []
+        for filt in self.filters + [{"section": {"$in": sections}} for _, sections in self.pair_rules]:
+            if filt not in filters:
+                filters.append(filt)
+        return filters
+
+    def match(self, query: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns the metadata filter for `query`, or None.
+
+        The returned dict is shared between calls; treat it as read-only.
+        """
+        q = query.lower()
+
+        if self._pattern is not None:
+            best = None
+            for m in self._pattern.finditer(q):
+                priority = self._priority[m.group(1)]
+                if best is None or priority < best:
+                    best = priority
+                    if best == 0:
+                        break
+            if best is not None:
+                return self.filters[best]
+
+        for pat, sections in self.pair_rules:
+            if pat.search(q):
+                return {"section": {"$in": sections}}
+        return None
+
+
+_matcher = TriggerMatcher.from_file()
+
+
+def detect_metadata_filter(query: str) -> Optional[Dict[str, Any]]:
+    """
+    Look for trigger phrases in the query and return an appropriate
+    metadata filter for your vector store.
+    """
+    return _matcher.match(query)
+
+
+def all_metadata_filters() -> List[Dict[str, Any]]:
+    """
+    Every filter detect_metadata_filter can produce (used to plan shards at ingest).
+    """
+    return _matcher.all_filters()
@@ -0,0 +1,184 @@
+"""
+Synonym-based query expansion for retrieval.
+
+Synonyms live in data/query_expansions.json. The index is compiled once at
+import into a single word-boundary regex, so "eat" no longer fires inside
+"treatment" or "great". Each variant carries a weight that decays with the
+synonym's position in its list (the first synonym is the closest one);
+callers can cap the number of variants and drop low-weight ones.
+
+Every variant is one more embedding and one more search, so under load
+`retrieval_load` tightens both limits as concurrent retrievals pile up,
+down to searching the original question alone.
+"""
+
+import json
+import os
+import re
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+EXPANSIONS_PATH = Path(__file__).resolve().parent.parent / "data" / "query_expansions.json"
+
+# variants per question on top of the original query
+MAX_EXPANSIONS = int(os.getenv("QUERY_EXPANSION_MAX", "6"))
+# variants below this weight are skipped
+MIN_WEIGHT = float(os.getenv("QUERY_EXPANSION_MIN_WEIGHT", "0.0"))
+
+# retrievals in flight above which expansion starts shrinking, and at
+# which only the original question is searched
+SHED_START = int(os.getenv("QUERY_EXPANSION_SHED_START", "4"))
+SHED_FULL = int(os.getenv("QUERY_EXPANSION_SHED_FULL", "16"))
+
+WEIGHT_DECAY = 0.15
+WEIGHT_FLOOR = 0.25
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+class SynonymIndex:
+    """
+    Word-boundary-aware synonym lookup built once from a key -> synonyms dict.
+    """
+
+    def __init__(self, expansions: Dict[str, List[str]]):
+        self.synonyms: Dict[str, List[Tuple[str, float]]] = {}
+        for key, terms in expansions.items():
+            self.synonyms[key.lower()] = [
+                (term, max(WEIGHT_FLOOR, 1.0 - WEIGHT_DECAY * i))
+                for i, term in enumerate(terms)
+            ]
+
+        # longest keys first so "side effects" wins over a shorter overlapping key;
+        # an optional plural suffix keeps "clinical trials" matching "clinical trial"
+        keys = sorted(self.synonyms, key=len, reverse=True)
+        if keys:
+            alternation = "|".join(re.escape(k) for k in keys)
+            self._pattern: Optional[re.Pattern] = re.compile(rf"\b({alternation})(?:e?s)?\b", re.I)
+        else:
+            self._pattern = None
+
+    @classmethod
+    def from_file(cls, path: Path = EXPANSIONS_PATH) -> "SynonymIndex":
+        with open(path, encoding="utf-8") as fh:
+            return cls(json.load(fh))
+
+    def expand(
+        self,
+        query: str,
+        max_expansions: int = MAX_EXPANSIONS,
+        min_weight: float = MIN_WEIGHT,
+    ) -> List[Tuple[str, float]]:
+        """
+        Returns [(query, 1.0), (variant, weight), ...] with at most
+        `max_expansions` variants, highest weight first.
+
+        Each variant swaps one matched key for one synonym. Variants that are
+        identical to the query or to an earlier variant are dropped.
+        """
+        results: List[Tuple[str, float]] = [(query, 1.0)]
+        if self._pattern is None or max_expansions <= 0:
+            return results
+
+        variants: List[Tuple[str, float]] = []
+        for m in self._pattern.finditer(query):
+            for term, weight in self.synonyms[m.group(1).lower()]:
+                if weight < min_weight:
+                    continue
+                variants.append((query[:m.start()] + term + query[m.end():], weight))
+
+        # stable sort keeps key order between equal weights, so the cap
+        # spreads across matched keys instead of exhausting the first one
+        variants.sort(key=lambda v: v[1], reverse=True)
+
+        seen = {_normalize(query)}
+        for text, weight in variants:
+            key = _normalize(text)
+            if key in seen:
+                continue
+            seen.add(key)
+            results.append((text, weight))
+            if len(results) > max_expansions:
+                break
+        return results
+
+
+class RetrievalLoad:
+    """
+    Counts retrievals in flight and turns that into expansion limits.
+
+    Up to `shed_start` concurrent retrievals get the configured limits.
+    Beyond that the variant cap falls and the weight cutoff rises linearly
+    until, at `shed_full`, no variants are searched.
+    """
+
+    def __init__(
+        self,
+        shed_start: int = SHED_START,
+        shed_full: int = SHED_FULL,
+        max_expansions: int = MAX_EXPANSIONS,
+        min_weight: float = MIN_WEIGHT,
+    ):
+        self.shed_start = shed_start
+        self.shed_full = max(shed_full, shed_start + 1)
+        self.max_expansions = max_expansions
+        self.min_weight = min_weight
+        self.in_flight = 0
+        self.peak = 0
+        self.shed = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def track(self) -> Iterator[None]:
+        with self._lock:
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def limits(self) -> Tuple[int, float]:
+        """
+        (max_expansions, min_weight) for a retrieval starting now.
+        """
+        in_flight = self.in_flight
+        if in_flight <= self.shed_start:
+            return self.max_expansions, self.min_weight
+        with self._lock:
+            self.shed += 1
+        pressure = min(1.0, (in_flight - self.shed_start) / (self.shed_full - self.shed_start))
+        max_expansions = int(round(self.max_expansions * (1.0 - pressure)))
+        min_weight = self.min_weight + (1.0 - self.min_weight) * pressure
+        return max_expansions, min_weight
+
+    def stats(self) -> Dict[str, Any]:
+        return {"in_flight": self.in_flight, "peak": self.peak, "shed": self.shed}
+
+
+_index = SynonymIndex.from_file()
+
+retrieval_load = RetrievalLoad()
+
+
+def expand_query_weighted(
+    query: str,
+    max_expansions: int = MAX_EXPANSIONS,
+    min_weight: float = MIN_WEIGHT,
+) -> List[Tuple[str, float]]:
+    """Expand query with related terms, returning (query, weight) pairs"""
+    return _index.expand(query, max_expansions=max_expansions, min_weight=min_weight)
+
+
+def expand_query(
+    query: str,
+    max_expansions: int = MAX_EXPANSIONS,
+    min_weight: float = MIN_WEIGHT,
+) -> List[str]:
+    """Expand query with related terms for better retrieval"""
+    return [text for text, _ in expand_query_weighted(query, max_expansions, min_weight)]
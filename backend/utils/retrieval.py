@@ -0,0 +1,212 @@
+"""
+Retrieval helpers for /get_context/: batched multi-query search and rank fusion.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# k constant from the original RRF paper; dampens the weight of top ranks
+RRF_K = 60
+
+
+def batched_query(
+    collection,
+    queries: List[str],
+    n_results: int,
+    where: Optional[Dict[str, Any]] = None,
+    include: Optional[List[str]] = None,
+    query_embeddings: Optional[List[Any]] = None,
+    fallback=None,
+) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+    """
+    Runs every query against the collection in a single `collection.query` call.
+
+    Pass `query_embeddings` when the queries were already embedded (e.g. via
+    the query embedding cache) so Chroma does not embed them again.
+
+    A filtered search (a `where`, or a shard passed as `collection` with
+    the whole corpus as `fallback`) that returns fewer than `n_results`
+    hits for a query is topped up from an unfiltered search of `fallback`
+    (default: `collection`), ranked after the filtered hits. Many sections
+    hold only a handful of chunks, and a too-narrow filter should never
+    leave the caller short of context. Returns the results and the filter
+    that was actually applied (None when it matched nothing at all).
+    """
+    include = include or ["documents", "distances"]
+    if query_embeddings is not None:
+        query_args = {"query_embeddings": query_embeddings}
+    else:
+        query_args = {"query_texts": queries}
+
+    results = collection.query(
+        **query_args,
+        n_results=n_results,
+        where=where,
+        include=include,
+    )
+    wide_source = fallback if fallback is not None else (collection if where is not None else None)
+    if wide_source is None or all(len(ids) >= n_results for ids in results["ids"]):
+        return results, where
+
+    wide = wide_source.query(
+        **query_args,
+        n_results=n_results,
+        include=include,
+    )
+    if not any(results["ids"]):
+        return wide, None
+    return _top_up(results, wide, n_results), where
+
+
+def _top_up(results: Dict[str, Any], wide: Dict[str, Any], n_results: int) -> Dict[str, Any]:
+    """
+    Appends each query's unfiltered hits not already present, up to n_results.
+    """
+    keys = ["ids"] + [
+        name for name in ("documents", "metadatas", "distances", "embeddings")
+        if results.get(name) is not None and wide.get(name) is not None
+    ]
+    merged: Dict[str, Any] = dict(results)
+    for key in keys:
+        merged[key] = []
+    for q, ids in enumerate(results["ids"]):
+        present = set(ids)
+        extra = [j for j, doc_id in enumerate(wide["ids"][q]) if doc_id not in present][:max(0, n_results - len(ids))]
+        for key in keys:
+            merged[key].append(list(results[key][q]) + [wide[key][q][j] for j in extra])
+    return merged
+
+
+def reciprocal_rank_fusion(
+    ranked_ids: List[List[str]],
+    weights: Optional[List[float]] = None,
+    k: int = RRF_K,
+) -> List[Tuple[str, float]]:
+    """
+    Merges several ranked id lists into one using (weighted) reciprocal rank fusion.
+
+    Each list contributes weight / (k + rank) to the score of every id it
+    contains. Returns (id, score) pairs sorted by descending fused score;
+    ties keep the order in which ids were first seen.
+    """
+    if weights is None:
+        weights = [1.0] * len(ranked_ids)
+
+    scores: Dict[str, float] = {}
+    for ids, weight in zip(ranked_ids, weights):
+        for rank, doc_id in enumerate(ids, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + weight / (k + rank)
+
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def fuse_query_results(
+    results: Dict[str, Any],
+    weights: Optional[List[float]] = None,
+    limit: Optional[int] = None,
+    extra_ranked_ids: Optional[List[List[str]]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Fuses the per-query result lists of a batched `collection.query` call.
+
+    `extra_ranked_ids` are further rankings (e.g. lexical hits) fused in
+    after the query results; `weights` then covers both. Returns one entry
+    per unique chunk with its document, the query index that ranked it
+    best, the RRF score and any other included fields. Chunks that only
+    appear in the extra rankings carry just their id and score; see
+    `fill_missing_candidates`.
+    """
+    fused = reciprocal_rank_fusion(list(results["ids"]) + list(extra_ranked_ids or []), weights=weights)
+    if limit is not None:
+        fused = fused[:limit]
+
+    # remember where each id was ranked best so we can pull its fields
+    best: Dict[str, Tuple[int, int]] = {}
+    for q_idx, ids in enumerate(results["ids"]):
+        for pos, doc_id in enumerate(ids):
+            if doc_id not in best or pos < best[doc_id][1]:
+                best[doc_id] = (q_idx, pos)
+
+    fields = [
+        name for name in ("documents", "metadatas", "distances", "embeddings")
+        if results.get(name) is not None
+    ]
+
+    candidates = []
+    for doc_id, score in fused:
+        if doc_id not in best:
+            candidates.append({"id": doc_id, "rrf_score": score, "query_index": None})
+            continue
+        q_idx, pos = best[doc_id]
+        candidate = {"id": doc_id, "rrf_score": score, "query_index": q_idx}
+        for name in fields:
+            candidate[name[:-1]] = results[name][q_idx][pos]
+        candidates.append(candidate)
+    return candidates
+
+
+def fill_missing_candidates(
+    collection,
+    candidates: List[Dict[str, Any]],
+    where: Optional[Dict[str, Any]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Fetches document and embedding for candidates that no dense query returned.
+
+    Uses one `collection.get` call; candidates the metadata filter excludes
+    are dropped. Order is preserved.
+    """
+    missing = [c["id"] for c in candidates if "document" not in c]
+    if not missing:
+        return candidates
+
+    fetched = collection.get(ids=missing, where=where, include=["documents", "embeddings"])
+    found = {
+        doc_id: (doc, emb)
+        for doc_id, doc, emb in zip(fetched["ids"], fetched["documents"], fetched["embeddings"])
+    }
+
+    filled = []
+    for c in candidates:
+        if "document" not in c:
+            if c["id"] not in found:
+                continue
+            c["document"], c["embedding"] = found[c["id"]]
+        filled.append(c)
+    return filled
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """
+    L2-normalizes each row of a 2-D array (zero rows are left as zeros).
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def embedding_similarities(
+    query_embedding,
+    candidates: List[Dict[str, Any]],
+    embedder=None,
+    doc_prefix: str = "",
+) -> np.ndarray:
+    """
+    Cosine similarity of the query against every candidate, in one matrix-vector product.
+
+    Uses the vectors Chroma returned with the candidates. Candidates without
+    one are re-embedded with a single batched `embedder` call.
+    """
+    missing = [i for i, c in enumerate(candidates) if c.get("embedding") is None]
+    if missing:
+        if embedder is None:
+            raise ValueError(f"{len(missing)} candidates have no stored embedding and no embedder was given")
+        fresh = embedder([f"{doc_prefix}{candidates[i]['document']}" for i in missing])
+        for i, vector in zip(missing, fresh):
+            candidates[i]["embedding"] = vector
+
+    doc_matrix = normalize_rows(np.stack([np.asarray(c["embedding"], dtype=np.float32) for c in candidates]))
+    query_vector = normalize_rows(np.asarray(query_embedding, dtype=np.float32).reshape(1, -1))[0]
+    return doc_matrix @ query_vector
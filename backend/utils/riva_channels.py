@@ -0,0 +1,229 @@
+"""
+Long-lived, pooled gRPC channels to the Riva servers.
+
+Building a riva.client.Auth opens a new channel, so doing it per request
+paid for a TLS handshake and a cold HTTP/2 connection on every utterance.
+The manager keeps a few authenticated channels per (server, metadata)
+and hands them out round-robin. A channel that drops into
+TRANSIENT_FAILURE or SHUTDOWN is skipped while gRPC reconnects it, and
+only rebuilt if it is still down once an exponential backoff runs out.
+The backoff resets when the channel reports READY.
+
+Keepalive: gRPC servers answer pings more frequent than their
+permit_keepalive_time (5 minutes by default) with GOAWAY too_many_pings,
+which would turn keepalive into reconnect churn. So pings go out every
+RIVA_KEEPALIVE_MS (default 300000) and, unless RIVA_KEEPALIVE_WHEN_IDLE is
+set, only while calls are in flight. Lower RIVA_KEEPALIVE_MS only for a
+server known to permit it, and set RIVA_KEEPALIVE_WHEN_IDLE=1 when a NAT
+or load balancer drops idle connections sooner than the server does.
+"""
+
+import itertools
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+RIVA_POOL_SIZE = int(os.getenv("RIVA_POOL_SIZE", "2"))
+RIVA_KEEPALIVE_MS = int(os.getenv("RIVA_KEEPALIVE_MS", "300000"))
+RIVA_KEEPALIVE_WHEN_IDLE = os.getenv("RIVA_KEEPALIVE_WHEN_IDLE", "false").lower() in ("1", "true", "yes")
+RIVA_KEEPALIVE_TIMEOUT_MS = int(os.getenv("RIVA_KEEPALIVE_TIMEOUT_MS", "10000"))
+RIVA_RECONNECT_BACKOFF = float(os.getenv("RIVA_RECONNECT_BACKOFF", "0.5"))
+RIVA_RECONNECT_BACKOFF_MAX = float(os.getenv("RIVA_RECONNECT_BACKOFF_MAX", "30"))
+
+# part of the pool key: every caller uses this default so warmup pre-connects
+# the same pools the handlers use
+MAX_MESSAGE_LENGTH = 1024 * 1024 * 100
+
+PoolKey = Tuple[Any, ...]
+
+
+def channel_options(max_message_length: int = MAX_MESSAGE_LENGTH) -> List[Tuple[str, int]]:
+    return [
+        ('grpc.max_receive_message_length', max_message_length),
+        ('grpc.max_send_message_length', max_message_length),
+        ('grpc.keepalive_time_ms', RIVA_KEEPALIVE_MS),
+        ('grpc.keepalive_timeout_ms', RIVA_KEEPALIVE_TIMEOUT_MS),
+        ('grpc.keepalive_permit_without_calls', int(RIVA_KEEPALIVE_WHEN_IDLE)),
+        ('grpc.enable_retries', 1),
+    ]
+
+
+class _PooledChannel:
+    """
+    One Auth (and its channel) plus the connectivity state gRPC last reported.
+    """
+
+    def __init__(self, auth_kwargs: Dict[str, Any], on_ready: Callable[[], None]):
+        import grpc
+        import riva.client
+
+        self.auth = riva.client.Auth(**auth_kwargs)
+        self.state = grpc.ChannelConnectivity.IDLE
+        self.created = time.monotonic()
+        self._on_ready = on_ready
+        # try_to_connect starts the handshake now rather than on first use
+        self.auth.channel.subscribe(self._on_state, try_to_connect=True)
+
+    def _on_state(self, state) -> None:
+        import grpc
+
+        self.state = state
+        if state == grpc.ChannelConnectivity.READY:
+            self._on_ready()
+
+    @property
+    def healthy(self) -> bool:
+        import grpc
+
+        return self.state not in (grpc.ChannelConnectivity.TRANSIENT_FAILURE, grpc.ChannelConnectivity.SHUTDOWN)
+
+    def close(self) -> None:
+        try:
+            self.auth.channel.unsubscribe(self._on_state)
+        except Exception:
+            pass
+        self.auth.channel.close()
+
+
+class _Pool:
+    def __init__(self, auth_kwargs: Dict[str, Any], size: int):
+        self.auth_kwargs = auth_kwargs
+        self.size = size
+        self.channels: List[Optional[_PooledChannel]] = [None] * size
+        self.retry_at = [0.0] * size
+        self.failures = [0] * size
+        self.reconnects = 0
+        self._next = itertools.count()
+
+    def _back_off(self, i: int, now: float) -> None:
+        self.failures[i] += 1
+        delay = min(RIVA_RECONNECT_BACKOFF * 2 ** (self.failures[i] - 1), RIVA_RECONNECT_BACKOFF_MAX)
+        self.retry_at[i] = now + delay
+
+    def _on_ready(self, i: int) -> None:
+        # called from gRPC's callback thread
+        self.failures[i] = 0
+        self.retry_at[i] = 0.0
+
+    def _slot(self, i: int) -> Optional[_PooledChannel]:
+        """
+        The channel in slot i: None while a failed open backs off, and an
+        unhealthy channel while gRPC reconnects it. A channel still down
+        at retry_at is rebuilt, and every rebuild doubles the next wait
+        until one reaches READY.
+        """
+        channel = self.channels[i]
+        if channel is not None and channel.healthy:
+            return channel
+        now = time.monotonic()
+        if channel is not None and not self.retry_at[i]:
+            # first seen down since it was last READY
+            self._back_off(i, now)
+        if now < self.retry_at[i]:
+            return channel
+        if channel is not None:
+            channel.close()
+            self.reconnects += 1
+        # set before opening, so a READY that arrives at once resets it
+        self._back_off(i, now)
+        try:
+            channel = _PooledChannel(self.auth_kwargs, on_ready=lambda: self._on_ready(i))
+        except Exception as e:
+            print(f"Could not open Riva channel to {self.auth_kwargs['uri']}: {e}")
+            channel = None
+        self.channels[i] = channel
+        return channel
+
+    def acquire(self):
+        start = next(self._next)
+        fallback = None
+        for offset in range(self.size):
+            i = (start + offset) % self.size
+            channel = self._slot(i)
+            if channel is None:
+                continue
+            if channel.healthy:
+                return channel.auth
+            fallback = fallback or channel
+        if fallback is not None:
+            # nothing looks healthy; let gRPC try (and fail fast) on one of them
+            return fallback.auth
+        raise ConnectionError(f"No Riva channel to {self.auth_kwargs['uri']} (backing off)")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "server": self.auth_kwargs["uri"],
+            "channels": [c.state.name if c is not None else "CLOSED" for c in self.channels],
+            "reconnects": self.reconnects,
+        }
+
+    def close(self) -> None:
+        for channel in self.channels:
+            if channel is not None:
+                channel.close()
+        self.channels = [None] * self.size
+
+
+class ChannelManager:
+    """
+    Hands out pooled riva.client.Auth objects for a server and call metadata.
+
+    Requests with the same server, TLS settings and metadata (function-id
+    and token) share a pool, so TTS and ASR each get their own.
+    """
+
+    def __init__(self, pool_size: int = RIVA_POOL_SIZE):
+        self.pool_size = max(1, pool_size)
+        self._pools: Dict[PoolKey, _Pool] = {}
+        self._lock = threading.Lock()
+
+    def get_auth(
+        self,
+        server: str,
+        use_ssl: bool = False,
+        metadata: Optional[Sequence[Sequence[str]]] = None,
+        ssl_root_cert: Optional[Union[str, Path]] = None,
+        ssl_client_cert: Optional[Union[str, Path]] = None,
+        ssl_client_key: Optional[Union[str, Path]] = None,
+        max_message_length: int = MAX_MESSAGE_LENGTH,
+    ):
+        metadata_args = [list(pair) for pair in metadata or []]
+        key = (
+            server,
+            use_ssl,
+            tuple(tuple(pair) for pair in metadata_args),
+            ssl_root_cert,
+            ssl_client_cert,
+            ssl_client_key,
+            max_message_length,
+        )
+        with self._lock:
+            pool = self._pools.get(key)
+            if pool is None:
+                auth_kwargs = {
+                    "ssl_root_cert": ssl_root_cert,
+                    "ssl_client_cert": ssl_client_cert,
+                    "ssl_client_key": ssl_client_key,
+                    "use_ssl": use_ssl,
+                    "uri": server,
+                    "metadata_args": metadata_args,
+                    "options": channel_options(max_message_length),
+                }
+                pool = _Pool(auth_kwargs, self.pool_size)
+                self._pools[key] = pool
+            return pool.acquire()
+
+    def stats(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [pool.stats() for pool in self._pools.values()]
+
+    def close(self) -> None:
+        with self._lock:
+            for pool in self._pools.values():
+                pool.close()
+            self._pools.clear()
+
+
+channel_manager = ChannelManager()
@@ -0,0 +1,192 @@
+"""
+Per-section shard collections for filtered queries.
+
+Ingest (utils/create_chroma.py --shards, and every later run while a
+shard map exists, until --no-shards) copies the chunks matching each
+filter detect_metadata_filter can emit, plus every section/super_section
+with enough chunks, into small collections next to jude-e-documents. The
+shard map (shards.json) records which collection answers which filter and
+the index version it was built for; the API only routes to shards whose
+version matches the store it opened, so it never reads a stale shard.
+"""
+
+import hashlib
+import json
+import os
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple, Union
+
+SHARD_MAP_FILE = "shards.json"
+SHARD_PREFIX = "jude-e-shard-"
+
+# fields whose frequent values get a shard of their own
+SHARDED_FIELDS = ("section", "super_section")
+
+ShardKey = Tuple[str, FrozenSet[str]]
+
+
+def shard_key(where: Optional[Dict[str, Any]]) -> Optional[ShardKey]:
+    """
+    (field, values) for a single-field $eq/$in filter, None for anything else.
+    """
+    if not where or len(where) != 1:
+        return None
+    (field, condition), = where.items()
+    if not isinstance(condition, dict):
+        return field, frozenset([condition])
+    if "$eq" in condition:
+        return field, frozenset([condition["$eq"]])
+    if "$in" in condition:
+        return field, frozenset(condition["$in"])
+    return None
+
+
+def _collection_name(version: str, key: ShardKey) -> str:
+    field, values = key
+    spec = hashlib.sha1(json.dumps([field, sorted(values)], ensure_ascii=False).encode("utf-8")).hexdigest()
+    tag = hashlib.sha1(version.encode("utf-8")).hexdigest()
+    # Chroma names: 3-63 chars of [a-zA-Z0-9._-]
+    return f"{SHARD_PREFIX}{tag[:8]}-{spec[:12]}"
+
+
+def plan_shards(collection, filters: List[Dict[str, Any]], min_chunks: int) -> List[ShardKey]:
+    """
+    The shards to build: one per routable filter, plus one per section or
+    super_section value with at least `min_chunks` chunks.
+    """
+    keys: List[ShardKey] = []
+    for where in filters:
+        key = shard_key(where)
+        if key is not None and key not in keys:
+            keys.append(key)
+
+    metadatas = collection.get(include=["metadatas"])["metadatas"]
+    for field in SHARDED_FIELDS:
+        counts = Counter(m.get(field) for m in metadatas if m and m.get(field) is not None)
+        for value, count in counts.items():
+            key = (field, frozenset([value]))
+            if count >= min_chunks and key not in keys:
+                keys.append(key)
+    return keys
+
+
+def build_shards(
+    client,
+    collection,
+    version: str,
+    chroma_path: Union[str, Path],
+    filters: List[Dict[str, Any]],
+    min_chunks: int = 20,
+    batch_size: int = 256,
+) -> Dict[str, Any]:
+    """
+    Writes one collection per planned shard for `version` and the shard map.
+
+    Shards of older versions are dropped, except the ones the currently
+    running API may still be routing to (the previous shard map).
+    """
+    previous = load_shard_map(chroma_path)
+    keep = {entry["collection"] for entry in (previous or {}).get("shards", [])}
+
+    entries = []
+    for key in plan_shards(collection, filters, min_chunks):
+        field, values = key
+        where = {field: {"$in": sorted(values)}} if len(values) > 1 else {field: {"$eq": next(iter(values))}}
+        chunks = collection.get(where=where, include=["documents", "metadatas", "embeddings"])
+        if not chunks["ids"]:
+            continue
+
+        name = _collection_name(version, key)
+        try:
+            client.delete_collection(name=name)
+        except Exception:
+            pass  # first build for this version
+        shard = client.create_collection(name=name)
+        for start in range(0, len(chunks["ids"]), batch_size):
+            stop = start + batch_size
+            shard.add(
+                ids=chunks["ids"][start:stop],
+                documents=chunks["documents"][start:stop],
+                metadatas=chunks["metadatas"][start:stop],
+                embeddings=chunks["embeddings"][start:stop],
+            )
+        entries.append({"field": field, "values": sorted(values), "collection": name, "count": len(chunks["ids"])})
+        keep.add(name)
+
+    _delete_shard_collections(client, keep)
+
+    shard_map = {"version": version, "shards": entries}
+    path = Path(chroma_path) / SHARD_MAP_FILE
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(shard_map, fh, ensure_ascii=False)
+    os.replace(tmp, path)
+    return shard_map
+
+
+def drop_shards(client, chroma_path: Union[str, Path]) -> int:
+    """
+    Removes the shard map and returns the number of shard collections deleted.
+
+    The collections of the map being removed are kept for one more ingest,
+    since the running API routes to them until it reopens the new version;
+    the next call deletes them.
+    """
+    previous = load_shard_map(chroma_path)
+    keep = {entry["collection"] for entry in (previous or {}).get("shards", [])}
+    deleted = _delete_shard_collections(client, keep)
+    if previous is not None:
+        os.remove(Path(chroma_path) / SHARD_MAP_FILE)
+    return deleted
+
+
+def _delete_shard_collections(client, keep) -> int:
+    deleted = 0
+    for existing in client.list_collections():
+        name = existing if isinstance(existing, str) else existing.name
+        if name.startswith(SHARD_PREFIX) and name not in keep:
+            client.delete_collection(name=name)
+            deleted += 1
+    return deleted
+
+
+def load_shard_map(chroma_path: Union[str, Path]) -> Optional[Dict[str, Any]]:
+    try:
+        with open(Path(chroma_path) / SHARD_MAP_FILE, encoding="utf-8") as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return None
+
+
+class ShardRouter:
+    """
+    Resolves a metadata filter to the shard collection that holds exactly its chunks.
+    """
+
+    def __init__(self, client, shard_map: Optional[Dict[str, Any]], version: str):
+        self.client = client
+        self._names: Dict[ShardKey, str] = {}
+        self._collections: Dict[str, Any] = {}
+        if shard_map and shard_map.get("version") == version:
+            for entry in shard_map["shards"]:
+                self._names[(entry["field"], frozenset(entry["values"]))] = entry["collection"]
+        elif shard_map:
+            print("Shard map is from another index version, routing everything to the main collection")
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def route(self, where: Optional[Dict[str, Any]]):
+        """
+        Returns the shard collection for `where`, or None when there is none.
+        """
+        key = shard_key(where)
+        name = self._names.get(key) if key is not None else None
+        if name is None:
+            return None
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self.client.get_collection(name=name)
+            self._collections[name] = collection
+        return collection
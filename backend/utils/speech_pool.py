@@ -0,0 +1,154 @@
+"""
+Runs the blocking Riva calls off the event loop.
+
+The riva client is synchronous, so /tts and /get_transcribe hand their
+calls to a small dedicated thread pool instead of running them inside the
+async handlers, where they froze the loop and stalled /get_context/ behind
+them. Each kind of call has its own concurrency limit and a per-call
+timeout, so a slow speech backend only queues speech requests.
+"""
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Optional
+
+SPEECH_WORKERS = int(os.getenv("SPEECH_WORKERS", "8"))
+# in-flight calls per kind; the rest wait (up to the timeout) for a slot
+TTS_CONCURRENCY = int(os.getenv("TTS_CONCURRENCY", "4"))
+ASR_CONCURRENCY = int(os.getenv("ASR_CONCURRENCY", "4"))
+TTS_TIMEOUT = float(os.getenv("TTS_TIMEOUT", "30"))
+ASR_TIMEOUT = float(os.getenv("ASR_TIMEOUT", "30"))
+
+
+class SpeechBusy(Exception):
+    """
+    Raised when a call did not get a slot or a result within its timeout.
+    """
+
+
+def _close_quietly(iterator) -> None:
+    try:
+        iterator.close()
+    except ValueError:
+        pass  # still running a next() that timed out; it ends with its RPC
+
+
+class SpeechPool:
+    """
+    A bounded thread pool with a concurrency limit and timeout per call kind.
+
+    A call that times out keeps its worker thread until the RPC returns
+    (threads cannot be cancelled), but the pool size caps how many such
+    threads can pile up.
+    """
+
+    def __init__(self, max_workers: int = SPEECH_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="speech")
+        self._limits: Dict[str, int] = {}
+        self._timeouts: Dict[str, float] = {}
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._in_flight: Dict[str, int] = {}
+        self._timed_out: Dict[str, int] = {}
+
+    def add_kind(self, kind: str, concurrency: int, timeout: float) -> None:
+        self._limits[kind] = concurrency
+        self._timeouts[kind] = timeout
+        self._in_flight[kind] = 0
+        self._timed_out[kind] = 0
+
+    def _semaphore(self, kind: str) -> asyncio.Semaphore:
+        # created lazily so it belongs to the server's event loop
+        semaphore = self._semaphores.get(kind)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self._limits[kind])
+            self._semaphores[kind] = semaphore
+        return semaphore
+
+    async def run(self, kind: str, fn: Callable[..., Any], *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """
+        Runs fn(*args, **kwargs) in the pool; the timeout covers waiting for a slot too.
+        """
+        timeout = self._timeouts[kind] if timeout is None else timeout
+        loop = asyncio.get_running_loop()
+
+        async def call():
+            async with self._semaphore(kind):
+                self._in_flight[kind] += 1
+                try:
+                    return await loop.run_in_executor(self._executor, lambda: fn(*args, **kwargs))
+                finally:
+                    self._in_flight[kind] -= 1
+
+        try:
+            return await asyncio.wait_for(call(), timeout=timeout)
+        except asyncio.TimeoutError:
+            self._timed_out[kind] += 1
+            raise SpeechBusy(f"{kind} did not finish within {timeout:g}s")
+
+    async def stream(
+        self,
+        kind: str,
+        fn: Callable[..., Iterator[Any]],
+        *args,
+        timeout: Optional[float] = None,
+        **kwargs,
+    ) -> AsyncIterator[Any]:
+        """
+        Iterates the blocking generator fn(*args, **kwargs) in the pool.
+
+        The slot is held until the generator is exhausted or closed. The
+        timeout applies to getting the slot and to each item, not to the
+        whole stream.
+        """
+        timeout = self._timeouts[kind] if timeout is None else timeout
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphore(kind)
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=timeout)
+        except asyncio.TimeoutError:
+            self._timed_out[kind] += 1
+            raise SpeechBusy(f"{kind} did not get a slot within {timeout:g}s")
+
+        self._in_flight[kind] += 1
+        done = object()
+        iterator = None
+        try:
+            iterator = await loop.run_in_executor(self._executor, lambda: iter(fn(*args, **kwargs)))
+            while True:
+                try:
+                    item = await asyncio.wait_for(
+                        loop.run_in_executor(self._executor, next, iterator, done),
+                        timeout=timeout,
+                    )
+                except asyncio.TimeoutError:
+                    self._timed_out[kind] += 1
+                    raise SpeechBusy(f"{kind} stalled for more than {timeout:g}s")
+                if item is done:
+                    return
+                yield item
+        finally:
+            self._in_flight[kind] -= 1
+            semaphore.release()
+            if hasattr(iterator, "close"):
+                # closing runs the generator's cleanup, which may block
+                self._executor.submit(_close_quietly, iterator)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            kind: {
+                "limit": self._limits[kind],
+                "in_flight": self._in_flight[kind],
+                "timed_out": self._timed_out[kind],
+                "timeout_s": self._timeouts[kind],
+            }
+            for kind in self._limits
+        }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+speech_pool = SpeechPool()
+speech_pool.add_kind("tts", TTS_CONCURRENCY, TTS_TIMEOUT)
+speech_pool.add_kind("asr", ASR_CONCURRENCY, ASR_TIMEOUT)
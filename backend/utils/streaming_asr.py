@@ -0,0 +1,55 @@
+"""
+Streaming speech recognition for the /ws/transcribe WebSocket.
+
+Microphone PCM arrives in small frames and is fed to Riva's streaming
+recognizer while the user is still speaking. Interim hypotheses and final
+transcripts come back as they are produced, instead of after the whole
+recording has been uploaded and recognized offline.
+"""
+
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from utils.riva_channels import channel_manager
+
+
+def transcribe_stream(
+    audio_chunks: Iterable[bytes],
+    server: str,
+    use_ssl: bool = True,
+    metadata: Optional[List[List[str]]] = None,
+    language_code: str = "en-US",
+    sample_rate_hz: int = 16000,
+    automatic_punctuation: bool = True,
+    interim_results: bool = True,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yields {"type": "interim"|"final", "transcript", "stability"} for 16-bit
+    mono LINEAR_PCM chunks at sample_rate_hz, as Riva returns them.
+    """
+    import riva.client
+
+    auth = channel_manager.get_auth(server, use_ssl=use_ssl, metadata=metadata)
+    asr_service = riva.client.ASRService(auth)
+    config = riva.client.StreamingRecognitionConfig(
+        config=riva.client.RecognitionConfig(
+            encoding=riva.client.AudioEncoding.LINEAR_PCM,
+            language_code=language_code,
+            sample_rate_hertz=sample_rate_hz,
+            audio_channel_count=1,
+            max_alternatives=1,
+            enable_automatic_punctuation=automatic_punctuation,
+            verbatim_transcripts=True,
+        ),
+        interim_results=interim_results,
+    )
+
+    responses = asr_service.streaming_response_generator(audio_chunks=audio_chunks, streaming_config=config)
+    for response in responses:
+        for result in response.results:
+            if not result.alternatives:
+                continue
+            yield {
+                "type": "final" if result.is_final else "interim",
+                "transcript": result.alternatives[0].transcript,
+                "stability": round(result.stability, 3),
+            }
@@ -22,7 +22,7 @@ import os
 from dotenv import load_dotenv
 import sys
 from pathlib import Path
-from typing import Optional, List, Union
+from typing import BinaryIO, Optional, List, Union
 
 try:
     import grpc
@@ -43,9 +43,12 @@ except ModuleNotFoundError as e:
     print("=" * 70)
     sys.exit(1)
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.riva_channels import MAX_MESSAGE_LENGTH, channel_manager
+
 
 def transcribe_file_offline(
-    input_file: Union[str, Path],
+    input_file: Union[str, Path, bytes, bytearray, memoryview, BinaryIO],
     server: str = "localhost:50051",
     use_ssl: bool = False,
     metadata: Optional[List[List[str]]] = None,
@@ -67,7 +70,7 @@ def transcribe_file_offline(
     stop_threshold: float = 0.0,
     stop_threshold_eou: float = 0.0,
     custom_configuration: str = "",
-    max_message_length: int = 134217728,
+    max_message_length: int = MAX_MESSAGE_LENGTH,
     ssl_root_cert: Optional[Union[str, Path]] = None,
     ssl_client_cert: Optional[Union[str, Path]] = None,
     ssl_client_key: Optional[Union[str, Path]] = None,
@@ -81,7 +84,8 @@ def transcribe_file_offline(
     and then a transcript for whole file is received in one response.
     
     Args:
-        input_file: Path to a local audio file to transcribe
+        input_file: Path to a local audio file to transcribe, or the audio
+                    itself as bytes or a binary file-like object
         server: URI of the Riva server (host:port)
         use_ssl: Whether to use SSL/TLS for secure connection
         metadata: List of metadata key-value pairs for authentication
@@ -140,27 +144,31 @@ def transcribe_file_offline(
         ...         for word_info in response.results[0].alternatives[0].words:
         ...             print(f"{word_info.word}: {word_info.start_time}ms - {word_info.end_time}ms")
     """
-    # Expand and validate input file path
-    input_file_path = Path(input_file).expanduser()
-    if not input_file_path.is_file():
-        print(f"Invalid input file path: {input_file_path}")
-        return None
-    
-    # Set up gRPC options
-    options = [
-        ('grpc.max_receive_message_length', max_message_length),
-        ('grpc.max_send_message_length', max_message_length)
-    ]
+    # Audio can be passed in memory (e.g. straight from an upload) or as a path
+    if isinstance(input_file, (bytes, bytearray, memoryview)):
+        input_file_path = None
+        data = bytes(input_file)
+    elif hasattr(input_file, "read"):
+        input_file_path = None
+        data = input_file.read()
+    else:
+        # Expand and validate input file path
+        input_file_path = Path(input_file).expanduser()
+        if not input_file_path.is_file():
+            print(f"Invalid input file path: {input_file_path}")
+            return None
+        with input_file_path.open('rb') as fh:
+            data = fh.read()
     
-    # Create authentication object
-    auth = riva.client.Auth(
+    # Reuse a pooled, already-connected channel instead of a new handshake
+    auth = channel_manager.get_auth(
+        server,
+        use_ssl=use_ssl,
+        metadata=metadata,
         ssl_root_cert=ssl_root_cert,
         ssl_client_cert=ssl_client_cert,
         ssl_client_key=ssl_client_key,
-        use_ssl=use_ssl,
-        uri=server,
-        metadata_args=metadata,
-        options=options
+        max_message_length=max_message_length,
     )
     
     # Create ASR service
@@ -199,10 +207,6 @@ def transcribe_file_offline(
     # Add custom configuration
     riva.client.add_custom_configuration_to_config(config, custom_configuration)
     
-    # Read audio file
-    with input_file_path.open('rb') as fh:
-        data = fh.read()
-    
     # Perform recognition
     try:
         response = asr_service.offline_recognize(data, config)
@@ -211,7 +215,7 @@ def transcribe_file_offline(
         if print_results:
             seglst_output_file = None
             if output_seglst:
-                seglst_output_file = input_file_path.stem
+                seglst_output_file = input_file_path.stem if input_file_path else "transcript"
             
             riva.client.print_offline(
                 response=response,
@@ -230,7 +234,7 @@ def list_models(
     server: str = "localhost:50051",
     use_ssl: bool = False,
     metadata: Optional[List[List[str]]] = None,
-    max_message_length: int = 134217728,
+    max_message_length: int = MAX_MESSAGE_LENGTH,
     ssl_root_cert: Optional[Union[str, Path]] = None,
     ssl_client_cert: Optional[Union[str, Path]] = None,
     ssl_client_key: Optional[Union[str, Path]] = None,
@@ -260,21 +264,15 @@ def list_models(
         >>> if models:
         ...     print("Available models:", models)
     """
-    # Set up gRPC options
-    options = [
-        ('grpc.max_receive_message_length', max_message_length),
-        ('grpc.max_send_message_length', max_message_length)
-    ]
-    
-    # Create authentication object
-    auth = riva.client.Auth(
+    # Reuse a pooled, already-connected channel instead of a new handshake
+    auth = channel_manager.get_auth(
+        server,
+        use_ssl=use_ssl,
+        metadata=metadata,
         ssl_root_cert=ssl_root_cert,
         ssl_client_cert=ssl_client_cert,
         ssl_client_key=ssl_client_key,
-        use_ssl=use_ssl,
-        uri=server,
-        metadata_args=metadata,
-        options=options
+        max_message_length=max_message_length,
     )
     
     # Create ASR service
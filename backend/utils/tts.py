@@ -1,27 +1,31 @@
 import json
+import os
+import re
+import struct
+import threading
 import wave
-import uuid
 import time
 from pathlib import Path
 
-import riva.client
-from riva.client.proto.riva_audio_pb2 import AudioEncoding
-import riva.client.proto.riva_tts_pb2 as riva_tts
+from utils.audio_cache import AudioCache, audio_key
+from utils.riva_channels import channel_manager
 
 OUTPUT_DIR = Path("audiofiles")
 OUTPUT_DIR.mkdir(exist_ok=True)
 
+# synthesized audio is cached in OUTPUT_DIR under a hash of its inputs
+audio_cache = AudioCache(OUTPUT_DIR)
+
+# how long a fetched voice catalog is served before it is fetched again
+VOICE_CATALOG_TTL = float(os.getenv("VOICE_CATALOG_TTL", "3600"))
+
 
 def get_tts_service(server: str, use_ssl: bool = False, metadata: list[tuple[str, str]] = None):
-    auth = riva.client.Auth(
-        use_ssl=use_ssl,
-        uri=server,
-        metadata_args=metadata or [],
-        options=[
-            ('grpc.max_receive_message_length', 1024 * 1024 * 100),
-            ('grpc.max_send_message_length', 1024 * 1024 * 100),
-        ],
-    )
+    # riva (and grpc) are imported on first use, not when the API starts
+    import riva.client
+
+    # the service is only a stub; the channel under it is pooled and reused
+    auth = channel_manager.get_auth(server, use_ssl=use_ssl, metadata=metadata)
     return riva.client.SpeechSynthesisService(auth)
 
 
@@ -29,6 +33,8 @@ def list_voices(service):
     """
     Returns available voices grouped by language code.
     """
+    import riva.client.proto.riva_tts_pb2 as riva_tts
+
     config_response = service.stub.GetRivaSynthesisConfig(
         riva_tts.RivaSynthesisConfigRequest()
     )
@@ -47,6 +53,30 @@ def list_voices(service):
     return voices
 
 
+_voice_catalog: dict = {}
+_voice_catalog_lock = threading.Lock()
+
+
+def get_voices(
+    server: str,
+    use_ssl: bool = True,
+    metadata: list[tuple[str, str]] = None,
+    refresh: bool = False,
+) -> dict:
+    """
+    Returns list_voices for the server, fetched at most once per VOICE_CATALOG_TTL.
+    """
+    key = (server, use_ssl, tuple(tuple(pair) for pair in metadata or []))
+    with _voice_catalog_lock:
+        entry = _voice_catalog.get(key)
+        if entry is not None and not refresh and time.monotonic() - entry[0] < VOICE_CATALOG_TTL:
+            return entry[1]
+        # held across the RPC so concurrent misses share one fetch
+        voices = list_voices(get_tts_service(server, use_ssl=use_ssl, metadata=metadata))
+        _voice_catalog[key] = (time.monotonic(), voices)
+        return voices
+
+
 def synthesize_text_to_wav(
     text: str,
     server: str,
@@ -58,42 +88,150 @@ def synthesize_text_to_wav(
     use_ssl: bool = True,
 ) -> tuple[str, float]:
     """
-    Synthesizes text to a WAV file and returns (file_path, time_spent).
-    """
-    service = get_tts_service(server, use_ssl=use_ssl, metadata=metadata)
+    Synthesizes text to an audio file and returns (file_path, time_spent).
 
-    # Get available voices
-    voices = list_voices(service)
+    LINEAR_PCM is written as a .wav; OGGOPUS audio already comes back from
+    Riva as an Ogg container and is stored as-is in a much smaller .ogg.
+    Audio already synthesized for the same text and settings comes from
+    the audio cache without an RPC, with time_spent 0.0.
+    """
 
-    # Pick voice if not explicitly provided
+    # Pick voice if not explicitly provided; the catalog is cached, and
+    # skipped entirely when the caller names a voice
     if not voice:
+        voices = get_voices(server, use_ssl=use_ssl, metadata=metadata)
         available = voices.get(language_code, [])
         if not available:
             raise ValueError(f"No voices available for language {language_code}")
         voice = available[0]  # pick the first available voice
 
-    # Correct encoding enum
-    encoding_enum = AudioEncoding.OGGOPUS if encoding == "OGGOPUS" else AudioEncoding.LINEAR_PCM
+    time_spent = 0.0
+
+    def synthesize(file_path: Path) -> None:
+        nonlocal time_spent
+        from riva.client.proto.riva_audio_pb2 import AudioEncoding
+
+        service = get_tts_service(server, use_ssl=use_ssl, metadata=metadata)
+
+        # Correct encoding enum
+        encoding_enum = AudioEncoding.OGGOPUS if encoding == "OGGOPUS" else AudioEncoding.LINEAR_PCM
+
+        start = time.time()
+        resp = service.synthesize(
+            text,
+            voice,
+            language_code,
+            sample_rate_hz=sample_rate_hz,
+            encoding=encoding_enum,
+        )
+        stop = time.time()
+        time_spent = round(stop - start, 3)
+
+        if encoding == "OGGOPUS":
+            with open(file_path, 'wb') as out_f:
+                out_f.write(resp.audio)
+            return
+
+        # Write audio to WAV file
+        with wave.open(str(file_path), 'wb') as out_f:
+            out_f.setnchannels(1)
+            out_f.setsampwidth(2)
+            out_f.setframerate(sample_rate_hz)
+            out_f.writeframes(resp.audio)
+
+    key = audio_key(text, voice, language_code, sample_rate_hz, encoding)
+    suffix = ".ogg" if encoding == "OGGOPUS" else ".wav"
+    file_path = audio_cache.get_or_create(key, synthesize, suffix=suffix)
+    return str(file_path), time_spent
+
 
-    start = time.time()
-    resp = service.synthesize(
-        text,
-        voice,
-        language_code,
-        sample_rate_hz=sample_rate_hz,
-        encoding=encoding_enum,
+# split after ., ! or ? (and any closing quotes/brackets) followed by whitespace
+_SENTENCE_END = re.compile(r'(?<=[.!?])["\')\]]*\s+')
+
+
+def split_sentences(text: str, min_chars: int = 20) -> list[str]:
+    """
+    Splits text at sentence boundaries, merging fragments shorter than
+    min_chars into the next sentence so "Dr. Smith" style splits and very
+    short sentences do not each cost a synthesis call.
+    """
+    sentences = []
+    pending = ""
+    for part in _SENTENCE_END.split(text.strip()):
+        pending = f"{pending} {part}".strip() if pending else part.strip()
+        if len(pending) >= min_chars:
+            sentences.append(pending)
+            pending = ""
+    if pending:
+        if sentences and len(pending) < min_chars:
+            sentences[-1] = f"{sentences[-1]} {pending}"
+        else:
+            sentences.append(pending)
+    return sentences
+
+
+def wav_header(sample_rate_hz: int, channels: int = 1, sample_width: int = 2, data_size: int = 0xFFFFFFFF - 36) -> bytes:
+    """
+    A 44-byte PCM WAV header. The default data size marks a stream of
+    unknown length, which browsers play as it arrives.
+    """
+    byte_rate = sample_rate_hz * channels * sample_width
+    return (
+        b"RIFF" + struct.pack("<I", data_size + 36) + b"WAVE"
+        + b"fmt " + struct.pack("<IHHIIHH", 16, 1, channels, sample_rate_hz, byte_rate, channels * sample_width, sample_width * 8)
+        + b"data" + struct.pack("<I", data_size)
     )
-    stop = time.time()
 
-    # Generate unique file name
-    file_id = str(uuid.uuid4())
-    file_path = OUTPUT_DIR / f"{file_id}.wav"
 
-    # Write audio to WAV file
-    with wave.open(str(file_path), 'wb') as out_f:
-        out_f.setnchannels(1)
-        out_f.setsampwidth(2)
-        out_f.setframerate(sample_rate_hz)
-        out_f.writeframes(resp.audio)
+def synthesize_stream(
+    text: str,
+    server: str,
+    voice: str = None,
+    language_code: str = "en-US",
+    sample_rate_hz: int = 44100,
+    metadata: list[tuple[str, str]] = None,
+    use_ssl: bool = True,
+):
+    """
+    Yields 16-bit mono PCM chunks for text as they are synthesized.
+
+    Each sentence goes through Riva's streaming synthesis (synthesize_online),
+    so the first audio arrives after the first sentence instead of after
+    the whole text.
+    """
+    from riva.client.proto.riva_audio_pb2 import AudioEncoding
+
+    if not voice:
+        available = get_voices(server, use_ssl=use_ssl, metadata=metadata).get(language_code, [])
+        if not available:
+            raise ValueError(f"No voices available for language {language_code}")
+        voice = available[0]
+
+    service = get_tts_service(server, use_ssl=use_ssl, metadata=metadata)
+    for sentence in split_sentences(text):
+        responses = service.synthesize_online(
+            sentence,
+            voice,
+            language_code,
+            sample_rate_hz=sample_rate_hz,
+            encoding=AudioEncoding.LINEAR_PCM,
+        )
+        for resp in responses:
+            if resp.audio:
+                yield resp.audio
+
+
+def channel_ready(server: str, use_ssl: bool = True, metadata: list[tuple[str, str]] = None, timeout: float = 5.0) -> bool:
+    """
+    Waits until a pooled channel to the Riva server is connected.
 
-    return str(file_path), round(stop - start, 3)
+    The channel stays open afterwards, so this also pre-connects the pool.
+    """
+    import grpc
+
+    auth = channel_manager.get_auth(server, use_ssl=use_ssl, metadata=metadata)
+    try:
+        grpc.channel_ready_future(auth.channel).result(timeout=timeout)
+        return True
+    except grpc.FutureTimeoutError:
+        return False
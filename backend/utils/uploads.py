@@ -0,0 +1,96 @@
+"""
+Reads one file out of a multipart upload straight from the request body.
+
+Starlette's form parser spools any part over 1 MB to a temporary file and
+only hands the request over once the whole body has arrived, so a size
+limit checked in the handler comes too late and the audio touches disk
+anyway. This feeds the body to the multipart parser as it streams in,
+keeps the wanted part in memory and stops at the first byte over the
+limit.
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class BadUpload(ValueError):
+    pass
+
+
+async def read_multipart_file(request, field: str, limit: int) -> Tuple[Optional[str], bytes]:
+    """
+    Returns (filename, content) of the `field` part of a multipart/form-data request.
+
+    Raises UploadTooLarge as soon as the body passes `limit` bytes (or
+    up front when Content-Length says it will), BadUpload when the body
+    is not multipart or has no such part.
+    """
+    length = request.headers.get("content-length")
+    if length is not None and length.isdigit() and int(length) > limit:
+        raise UploadTooLarge()
+
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise BadUpload("Expected a multipart/form-data upload")
+
+    part: Dict[str, bytes] = {}
+    header_field: List[bytes] = []
+    header_value: List[bytes] = []
+    data: List[bytes] = []
+    found: Dict[str, object] = {}
+
+    def on_part_begin():
+        part.clear()
+        data.clear()
+
+    def on_header_field(buf, start, end):
+        header_field.append(buf[start:end])
+
+    def on_header_value(buf, start, end):
+        header_value.append(buf[start:end])
+
+    def on_header_end():
+        part[b"".join(header_field).lower().decode("latin-1")] = b"".join(header_value)
+        header_field.clear()
+        header_value.clear()
+
+    def on_part_data(buf, start, end):
+        data.append(bytes(buf[start:end]))
+
+    def on_part_end():
+        _, disposition = parse_options_header(part.get("content-disposition", b""))
+        if disposition.get(b"name", b"").decode("utf-8", "replace") == field and "content" not in found:
+            filename = disposition.get(b"filename")
+            found["filename"] = filename.decode("utf-8", "replace") if filename is not None else None
+            found["content"] = b"".join(data)
+        data.clear()
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > limit:
+            raise UploadTooLarge()
+        parser.write(chunk)
+    parser.finalize()
+
+    if "content" not in found:
+        raise BadUpload(f"No '{field}' part in the upload")
+    return found["filename"], found["content"]
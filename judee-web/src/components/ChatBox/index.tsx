@@ -5,7 +5,7 @@ import Typography from '@mui/material/Typography';
 import IconButton from '@mui/material/IconButton';
 import MicRipple from '@components/MicRipple';
 import { useRef, useEffect, useCallback } from "react";
-import { API_ENDPOINTS } from "@constants";
+import { API_ENDPOINTS, TTS_FORMAT } from "@constants";
 import { useAppState } from '@components/AppStateProvider/AppStateProvider';
 import ReactMarkdown from 'react-markdown';
 // import { audio } from "motion/react-client";
@@ -230,6 +230,7 @@ const ChatBox = () => {
                     const formData = new FormData();
                     formData.append('text', lastMessageByJudee);
                     formData.append('text_id', uniqueTextId || '');
+                    formData.append('format', TTS_FORMAT);
 
                     const response = await fetch(API_ENDPOINTS.TTS_API_URL, {
                         method: "POST",
@@ -1,9 +1,12 @@
 const API_BASE_URL = 'http://localhost:3001/api';
 const TTS_BASE_URL = 'http://localhost:8000/';
+// 'ogg' (Opus) is a fraction of the size of 'wav' over the kiosk Wi-Fi
+const TTS_FORMAT = 'ogg';
 
 const API_ENDPOINTS = {
   TTS_BASE_URL: TTS_BASE_URL,
-  CHAT_API: `${API_BASE_URL}/chat`,
+  // retrieval + generation in one streaming call to the backend
+  CHAT_API: `${TTS_BASE_URL}chat`,
   TRANSCRIBE: `http://localhost:8000/get_transcribe`,
   TTS_API_URL: `${TTS_BASE_URL}tts`,
 };
@@ -12,4 +15,4 @@ const PAGES = {
   HOME: '/',
 }
 
-export { API_BASE_URL, API_ENDPOINTS, PAGES };
+export { API_BASE_URL, API_ENDPOINTS, PAGES, TTS_FORMAT };